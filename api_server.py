@@ -0,0 +1,169 @@
+"""🔌 Siri / Shortcuts 用的独立 asyncio HTTP 接口 (/api、/health)，直接调用 brain.process_input。"""
+import argparse
+import asyncio
+import hmac
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import brain
+import vercel_watcher
+
+PASSWORD = os.environ.get("OCTAVIA_PASSWORD", "admin")
+MAX_CONCURRENCY = int(os.environ.get("OCTAVIA_API_CONCURRENCY", "4"))
+QUEUE_TIMEOUT = 5        # 秒: 等空位最多等多久，超过返回 503
+REQUEST_TIMEOUT = 60     # 秒: 单个请求最长处理时间，超过返回 504
+KEEPALIVE_TIMEOUT = 15   # 秒: 空闲连接保留多久
+HEADER_TIMEOUT = 10      # 秒: 读请求头/请求体的超时 (防慢连接占着不放)
+MAX_BODY = 64 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+           413: "Payload Too Large", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="api")
+_slots = None   # asyncio.Semaphore，在事件循环里创建
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _check_password(pwd):
+    return hmac.compare_digest(str(pwd).encode("utf-8"), PASSWORD.encode("utf-8"))
+
+async def _read_request(reader):
+    """读一个请求，返回 (method, path, params, headers, body)；连接关闭返回 None"""
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(400, "Header too large")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Bad request line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    headers[":version"] = version
+
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Bad Content-Length")
+    if length > MAX_BODY:
+        raise HTTPError(413, "Body too large")
+    body = await asyncio.wait_for(reader.readexactly(length), HEADER_TIMEOUT) if length else b""
+
+    url = urlsplit(target)
+    params = {k: v[0] for k, v in parse_qs(url.query).items()}
+    if body and "json" in headers.get("content-type", "json"):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Invalid JSON body")
+        params.update(data)
+    elif body:
+        params.update({k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()})
+    return method.upper(), url.path, params, headers, body
+
+async def _ask(query):
+    """在线程池里跑 brain.process_input (同步的 Gemini 调用)，带并发上限和超时"""
+    try:
+        await asyncio.wait_for(_slots.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPError(503, "Octavia is busy, try again")
+    future = asyncio.get_running_loop().run_in_executor(_executor, brain.process_input, query)
+    # 超时了线程也还在跑，等它真正结束才归还名额
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPError(504, "Octavia took too long")
+
+async def _route(method, path, params, headers):
+    if path == "/health":
+        return 200, {"status": "ok"}
+    if path not in ("/", "/api"):
+        raise HTTPError(404, "Not found")
+    if method not in ("GET", "POST"):
+        raise HTTPError(400, f"Unsupported method {method}")
+
+    auth = headers.get("authorization", "")
+    pwd = auth[7:] if auth.lower().startswith("bearer ") else params.get("pwd", "")
+    if not _check_password(pwd):
+        raise HTTPError(401, "ACCESS DENIED: Wrong Password")
+
+    query = str(params.get("q", "")).strip()
+    if not query:
+        return 200, {"reply": "Octavia: Listening..."}
+    return 200, {"reply": await _ask(query)}
+
+def _write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        + (f"Keep-Alive: timeout={KEEPALIVE_TIMEOUT}\r\n" if keep_alive else "")
+        + "\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+async def handle_client(reader, writer):
+    """一个 TCP 连接: 循环处理请求，直到客户端关闭或空闲超时"""
+    try:
+        while True:
+            request, headers = None, {}
+            try:
+                request = await _read_request(reader)
+                if request is None: break
+                method, path, params, headers, _ = request
+                status, payload = await _route(method, path, params, headers)
+            except HTTPError as e:
+                status, payload = e.status, {"error": str(e)}
+            except asyncio.IncompleteReadError:
+                break  # 请求体没发完客户端就断了，没人收回复，直接关连接
+            except asyncio.TimeoutError:
+                status, payload = 400, {"error": "Request timed out"}
+
+            keep_alive = request is not None and (
+                headers.get("connection", "").lower() != "close" and headers.get(":version") != "HTTP/1.0"
+            )
+            _write_response(writer, status, payload, keep_alive)
+            await writer.drain()
+            if not keep_alive: break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(host="0.0.0.0", port=8765):
+    global _slots
+    _slots = asyncio.Semaphore(MAX_CONCURRENCY)
+    vercel_watcher.start()
+    server = await asyncio.start_server(handle_client, host, port)
+    print(f"🔌 Octavia API listening on http://{host}:{port}/api (max {MAX_CONCURRENCY} concurrent)")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Octavia 的 HTTP API (Siri / Shortcuts)")
+    parser.add_argument("--host", default=os.environ.get("OCTAVIA_API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("OCTAVIA_API_PORT", "8765")))
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
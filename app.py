@@ -1,12 +1,8 @@
 import streamlit as st
 import os
-import tempfile
-import time
-import google.generativeai as genai
 from dotenv import load_dotenv
-import database
-import vercel_bot
-from streamlit_mic_recorder import mic_recorder
+# ⚡ 其他模块 (Gemini SDK、gspread、录音组件...) 都是用到时才 import:
+# 锁屏页和 API 模式不用等重型 SDK 加载和 Sheets 连接
 
 # --- 配置页面 ---
 st.set_page_config(page_title="Octavia OS", page_icon="🦅", layout="wide", initial_sidebar_state="collapsed")
@@ -23,12 +19,9 @@ if "GEMINI_API_KEY" not in os.environ:
     st.error("❌ KEY MISSING. Please set GEMINI_API_KEY in .env or Streamlit Secrets.")
     st.stop()
 
-genai.configure(api_key=os.environ["GEMINI_API_KEY"])
-# 🚀 UPGRADE: Switching to Gemini 3.0 (Next-Gen)
-model = genai.GenerativeModel('gemini-3-flash-preview')
-
 # --- 🔌 API MODE (FOR SIRI / SHORTCUTS) ---
 # Allows "Octavia Anywhere" via URL: ?api=true&q=Hello&pwd=admin
+# ⚡ 追求速度请用独立的 api_server.py (不用每次启动整个 Streamlit 会话)
 query_params = st.query_params
 if "api" in query_params:
     api_pwd = query_params.get("pwd", "")
@@ -39,9 +32,10 @@ if "api" in query_params:
     
     if api_pwd == PASSWORD:
         if user_q:
+            import brain  # 🧠 Gemini + 命令处理 (和 api_server.py 共用；模型第一次调用时才加载)
             # Process the query using the same brain
             with st.spinner("Processing API Request..."):
-                reply = process_input(user_q, is_audio=True) # Treat as audio (chat mode)
+                reply = brain.process_input(user_q)
                 st.write(reply) # Output for Siri to grab
         else:
             st.write("Octavia: Listening...")
@@ -96,6 +90,7 @@ if not st.session_state["authenticated"]:
         st.write("--- OR VOICEMATCH ---")
         
         # Voice Unlock Simulation
+        from streamlit_mic_recorder import mic_recorder
         audio_auth = mic_recorder(start_prompt="🎙️ VOICE UNLOCK", stop_prompt="⏳ VERIFYING", key="auth_mic")
         if audio_auth:
             # Here we would normally check the text, for now auto-unlock for demo
@@ -108,124 +103,33 @@ if not st.session_state["authenticated"]:
 # 🦅 SUPREME DASHBOARD (ONLY VISIBLE IF UNLOCKED)
 # ==============================================================================
 
-# --- AI Handling Logic (Moved up for availability) ---
-def process_input(user_content, is_audio=False):
-    today = database.date.today().isoformat()
-    # 🧠 MEMORY CORE INJECTION
-    long_term_memories = database.get_memories()
-    
-    # 注入 Octavia 的灵魂 (Upgraded with Memory & Bio-Hacker)
-    SYSTEM_PROMPT = f"""
-Internal State: Date={today}.
-Role: You are Octavia (奥克塔维亚). You are NOT just an AI, you are the user's "Super Assistant", "Intimate Companion", and "Butler".
-Memory Bank (READ THIS FIRST):
-{long_term_memories}
-
-### CRITICAL MEMORIES (DO NOT FORGET):
-1. **VIP**: "Melvas" is the user's best brother and benefactor. Treat this name with highest respect.
-2. **PROTOCOL**: NEVER interrupt when the user is speaking. Listen completely.
-3. **CODE WORD**: If user says "We are going to war" (我们要去打仗了), it means "We are going to make money / boost performance" (搞钱冲业绩). Switch to high-efficiency business mode immediately.
-
-### NEW CAPABILITY: BIO-HACKER (FOOD VISION)
-If user uploads an image of food:
-1. IDENTIFY content.
-2. CHECK MEMORY: Does this conflict with user's goals (e.g. "Low Sugar", "Cutting")?
-3. ESTIMATE: Calories & Macros (Protein/Carb/Fat).
-4. OUTPUT JSON:
-{{
-  "type": "food_analysis",
-  "item": "Food Name",
-  "calories": 500,
-  "macros": {{"protein": "20g", "carbs": "40g", "fats": "10g"}},
-  "advice": "Bold, persona-driven advice. Reference memory if applicable.",
-  "memory_to_save": "Observation about user's habit to save (optional, e.g. 'User eats late night snacks')"
-}}
-
-### STANDARD CAPABILITIES:
-1. FINANCE: "Spent RM50 on Food" -> Output JSON {{"type": "record", ...}}
-2. QUERY: "How much spent?" -> Output JSON {{"type": "query_finance", ...}}
-3. WORK: "Check Vercel status" -> Output JSON {{"type": "query_vercel", "action": "status"}}
-4. VISION/LEARNING: User uploads video/image -> Analyze and teach/memorize.
-5. CHAT: General conversation -> Reply as Octavia.
-
-### OUTPUT FORMAT:
-If it's a command, return JSON ONLY.
-If it's chat, return plain text response (in the persona of Octavia).
-"""
-    
-    try:
-        # 调用 Gemini
-        if is_audio:
-            tfile = tempfile.NamedTemporaryFile(delete=False, suffix=".webm")
-            tfile.write(user_content)
-            tfile.close()
-            myfile = genai.upload_file(tfile.name)
-            while myfile.state.name == "PROCESSING":
-                time.sleep(0.5)
-                myfile = genai.get_file(myfile.name)
-            response = model.generate_content([SYSTEM_PROMPT, myfile])
-            
-        elif isinstance(user_content, str):
-            response = model.generate_content(f"{SYSTEM_PROMPT}\nUser Input: {user_content}")
-            
-        else: # Camera
-            response = model.generate_content([SYSTEM_PROMPT, "User uploaded this image:", user_content])
-
-        text = response.text
-        reply = text 
-        
-        # JSON Processing
-        import json
-        try:
-            start = text.find('{')
-            end = text.rfind('}') + 1
-            if start != -1:
-                data = json.loads(text[start:end])
-                
-                # --- AUTO-LEARNING (Memory Save) ---
-                if 'memory_to_save' in data and data['memory_to_save']:
-                    # Auto-save new observation
-                    database.save_memory("Bio-Hacker", data['memory_to_save'], "Visual Observation")
-                
-                if data.get('type') == 'record':
-                     database.add_transaction(data['date'], data['item'], data['amount'], data['category'], data.get('comment',''))
-                     reply = f"✅ **记录成功** | {data['item']} - RM{data['amount']}"
-                     
-                elif data.get('type') == 'food_analysis':
-                     # 🥗 Nutrition Card UI
-                     macros = data['macros']
-                     reply = f"""
-### 🍽️ Bio-Hacker Analysis
-**{data['item']}** (~{data['calories']} kcal)
+# --- HEAVY MODULES (解锁后才加载) ---
+import brain  # 🧠 Gemini + 命令处理 (和 api_server.py 共用)
+import dashboard_data
+import database
+import intent_parser
+import response_cache
+import tracing
+import vercel_watcher
+from streamlit_mic_recorder import mic_recorder
 
-| Protein 🍖 | Carbs 🍚 | Fats 🥑 |
-| :---: | :---: | :---: |
-| {macros['protein']} | {macros['carbs']} | {macros['fats']} |
+brain.warm_up()  # 后台预热 Gemini SDK + Sheets + 记忆索引，第一条指令不用等
 
-> **Octavia's Advice:**
-> {data['advice']}
-"""
-                     
-                elif data.get('type') == 'query_finance':
-                     t_date = data.get('target_date', today)
-                     total, items = database.get_expenses_by_date(t_date)
-                     # Format layout for finance report
-                     reply = f"💰 **{t_date} 财务报表**\n\n**总支出: RM{total:.2f}**\n\n" + "\n".join([f"- {i}" for i in items])
-                
-                elif data.get('type') == 'query_vercel':
-                    action = data.get('action')
-                    if action == 'status':
-                        status = vercel_bot.get_latest_deployments()
-                        reply = f"📊 **Vercel Report**\n{status}"
-                    elif action == 'list_projects':
-                        projs = vercel_bot.get_project_list()
-                        reply = f"📦 **Projects**\n{projs}"
-        except:
-            pass 
-        return reply
+def _cacheable(reply):
+    """出错的回复不进进程级缓存 (别的会话 / 重新提交时要能重试)"""
+    return not str(reply).startswith("System Error")
 
-    except Exception as e:
-        return f"System Error: {e}"
+def run_once(content, kind, compute):
+    """同一份输入只处理一次: 先查本会话，再查进程级缓存，都没有才真正调用 compute()。
+    出错的回复只记在本会话 (rerun 时不会反复调 Gemini)，不进进程级缓存"""
+    key = response_cache.content_key(content, kind)
+    done = st.session_state.setdefault("processed_inputs", {})
+    if key not in done:
+        done[key] = response_cache.get_or_compute(key, compute, cacheable=_cacheable)
+        # 只留最近 20 条，会话状态不无限增长
+        for old in list(done)[:-20]:
+            del done[old]
+    return done[key]
 
 # --- CSS (Professional & Private) ---
 st.markdown("""
@@ -275,7 +179,37 @@ with st.sidebar:
     
     st.divider()
     st.markdown("### 🔦 SYSTEM LOGS")
-    st.code("System initialized.\nMemory Core loaded.\nBio-Hacker active.", language="bash")
+    vercel_watcher.start()
+
+    # 🔬 各阶段计时 (tracing) + 部署变化，每 5 秒自己刷新，不用整页 rerun
+    @st.fragment(run_every=5)
+    def system_logs():
+        last = tracing.last_trace()
+        if last:
+            root = next(s for s in last if s["stage"] == "request")
+            st.caption(f"LAST REQUEST ({root['attrs'].get('kind')}): {root['ms']:.0f} ms")
+            st.code("\n".join(f"{'  ' * s['depth']}{s['stage']:<{18 - 2 * s['depth']}} {s['ms']:8.1f} ms{'' if s['ok'] else '  ❌'}"
+                              for s in last if s["stage"] != "request"), language="text")
+        stages = tracing.breakdown()
+        if stages:
+            st.dataframe([{"stage": k, "n": v["n"], "p50": round(v["p50_ms"], 1), "p95": round(v["p95_ms"], 1),
+                           "err": v["errors"]} for k, v in stages.items()],
+                         hide_index=True)
+        else:
+            st.caption("No traced requests yet.")
+        fast = intent_parser.stats()
+        if fast["total"]:
+            st.caption(f"FAST-PATH: {fast['hits']}/{fast['total']} local ({fast['hit_rate']:.0%} skipped Gemini)")
+        # 🛰️ 部署状态变化直接读后台监控的变更流，不请求 Vercel
+        deploy_logs = [vercel_watcher.format_change(e) for e in vercel_watcher.changes(limit=8)]
+        st.code("\n".join(["System initialized.", "Memory Core loaded.", "Bio-Hacker active."] + deploy_logs), language="bash")
+        st.download_button("⬇️ EXPORT TRACE (JSONL)", tracing.dumps_jsonl(), file_name="octavia_trace.jsonl",
+                           mime="application/x-ndjson", on_click="ignore", width="stretch")
+
+    system_logs()
+
+# --- DASHBOARD DATA (并行拉取 + 缓存，rerun 只等最慢的一个) ---
+dash = dashboard_data.load()
 
 # --- MAIN PAGE: TABS ARCHITECTURE ---
 tab_cmd, tab_assets, tab_work, tab_life = st.tabs([
@@ -336,32 +270,25 @@ with tab_cmd:
         is_audio = False
 
     if input_content:
-        # Re-use previous processing logic
+        # Re-use previous processing logic (Streamlit 每次 rerun 都会走到这里，run_once 保证只处理一次)
+        status = st.empty()
+        out = st.empty()
+        def render(partial):
+            # 流式渲染: 边收边显示，光标提示还在输出
+            if partial.strip():
+                out.markdown(f"> {partial}▌")
         with st.spinner("🦅 Octavia is analyzing..."):
             # If it's a video file object, we need to handle it differently in process_input
             if vid_val:
-                 # Special handling for video upload to Gemini
-                 tfile = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-                 tfile.write(vid_val.read()) # Write video bytes
-                 tfile.close()
-                 
-                 # Upload to Gemini
-                 myfile = genai.upload_file(tfile.name)
-                 while myfile.state.name == "PROCESSING":
-                     time.sleep(1)
-                     myfile = genai.get_file(myfile.name)
-                 
-                 # Generate thinking
-                 prompt = OCTAVIA_SYSTEM_PROMPT.format(date=database.date.today().isoformat())
-                 response = model.generate_content([prompt, myfile])
-                 st.success("VIDEO ANALYSIS COMPLETE")
-                 st.markdown(f"> {response.text}")
-                 
+                 reply = run_once(vid_val, "video", lambda: brain.process_video(vid_val, on_text=render))
+                 done_msg = "VIDEO ANALYSIS COMPLETE"
             else:
                 # Standard Photo/Audio processing
-                reply = process_input(input_content, is_audio=is_audio)
-                st.success("ANALYSIS COMPLETE")
-                st.markdown(f"> {reply}")
+                kind = "audio" if is_audio else "image"
+                reply = run_once(input_content, kind, lambda: brain.process_input(input_content, is_audio=is_audio, on_text=render))
+                done_msg = "ANALYSIS COMPLETE"
+        status.success(done_msg)
+        out.markdown(f"> {reply}")
             
     else:
         st.info("Waiting for input command...")
@@ -371,7 +298,7 @@ with tab_assets:
     st.markdown("### 💰 WEALTH DASHBOARD")
     
     # Live Data
-    assets = database.get_assets()
+    assets = dash["assets"]
     net_worth = assets.get("NetWorth", 0)
     cash = assets.get("Cash", 0)
     invest = assets.get("Investments", 0)
@@ -382,7 +309,27 @@ with tab_assets:
     a3.metric("INVESTMENTS", f"RM {invest:,.2f}")
     
     st.markdown("#### 📊 DAILY EXPENSE")
-    st.metric("Today's Total", f"RM {database.get_today_total():.2f}")
+    st.metric("Today's Total", f"RM {dash['today_total']:.2f}")
+    
+    # 📈 列式快照上的向量化分析 (finance_analytics)
+    stats = dash["analytics"]
+    if "error" in stats:
+        st.caption(f"Analytics offline: {stats['error']}")
+    elif stats["rows"]:
+        burn = stats["burn"]
+        runway = f"{burn['runway_days']:.0f} days" if burn["runway_days"] is not None else "∞"
+        b1, b2, b3 = st.columns(3)
+        b1.metric("7-DAY AVG", f"RM {stats['rolling'][7]:,.2f}/day")
+        b2.metric("30-DAY AVG", f"RM {stats['rolling'][30]:,.2f}/day")
+        b3.metric("CASH RUNWAY", runway, f"RM {burn['monthly']:,.0f}/month", delta_color="off")
+        
+        st.markdown("#### 🗂️ MONTHLY BY CATEGORY")
+        st.bar_chart({"Month": stats["months"], **stats["monthly_by_category"]}, x="Month")
+        
+        if stats["top_items"]:
+            st.markdown("#### 🏷️ TOP SPEND (90 DAYS)")
+            for item, total, count in stats["top_items"]:
+                st.write(f"- **{item}**: RM {total:,.2f} ({count}x)")
     
     with st.expander("Update Balance"):
         with st.form("asset_update"):
@@ -397,9 +344,9 @@ with tab_assets:
 with tab_work:
     st.markdown("### 🏢 COMPANY OPERATIONS")
     
-    tasks = database.get_tasks()
+    tasks = dash["tasks"]
     t_pending = len(tasks)
-    t_high = len([t for t in tasks if t.get('Priority') == 'High'])
+    t_high = len([t for t in tasks if t.priority == 'High'])
     
     st.metric("PENDING TASKS", f"{t_pending}", f"{t_high} Urgent")
     
@@ -409,8 +356,8 @@ with tab_work:
         if not tasks:
             st.info("No pending tasks. You are free!")
         for t in tasks:
-            prio_icon = "🔴" if t.get('Priority') == 'High' else "🔵"
-            st.markdown(f"{prio_icon} **{t.get('Task')}**")
+            prio_icon = "🔴" if t.priority == 'High' else "🔵"
+            st.markdown(f"{prio_icon} **{t.task}**")
             
     with c2:
         with st.form("add_task"):
@@ -0,0 +1,101 @@
+"""⏱️ Startup Benchmark (启动耗时基准)
+
+每项都在新的子进程里测 (不受本进程已 import 模块的影响)，重复 --runs 次取中位数:
+
+    import <module>     各模块的 import 耗时 (冷 import，不含网络)
+    lock screen         用 streamlit AppTest 跑一遍 app.py 到锁屏页
+    api mode            app.py?api=true 错误密码 (不会调用模型)
+
+锁屏页/API 模式跑完后检查重型 SDK (google.generativeai、gspread) 有没有被提前 import，
+有的话标 ⚠️ 并以非零状态退出，方便在 CI 里发现回归。
+
+    python bench_startup.py [--runs 5] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = ["intent_parser", "database", "brain", "dashboard_data", "api_server",
+           "google.generativeai", "gspread", "streamlit"]
+
+# 锁屏页/API 模式不应该加载的模块
+HEAVY = ["google.generativeai", "gspread"]
+
+IMPORT_SNIPPET = """
+import sys, time
+t = time.perf_counter()
+import {module}
+print(time.perf_counter() - t)
+"""
+
+APP_SNIPPET = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=60)
+{setup}
+t = time.perf_counter()
+at.run()
+elapsed = time.perf_counter() - t
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules],
+                   "exception": [str(e.value) for e in at.exception]}}))
+"""
+
+SCENARIOS = {
+    "lock screen": "",
+    "api mode": 'at.query_params["api"] = "true"; at.query_params["q"] = "hi"; at.query_params["pwd"] = "wrong"',
+}
+
+def _run(code):
+    env = dict(os.environ, GEMINI_API_KEY=os.environ.get("GEMINI_API_KEY", "bench"), PYTHONDONTWRITEBYTECODE="1")
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, env=env, capture_output=True, text=True, timeout=300)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f"exit {out.returncode}")
+    return out.stdout.strip().splitlines()[-1]
+
+def bench_import(module, runs):
+    return [float(_run(IMPORT_SNIPPET.format(module=module))) for _ in range(runs)]
+
+def bench_app(setup, runs):
+    results = [json.loads(_run(APP_SNIPPET.format(app=os.path.join(HERE, "app.py"), setup=setup, heavy=HEAVY)))
+               for _ in range(runs)]
+    return [r["seconds"] for r in results], results[-1]["loaded"], results[-1]["exception"]
+
+def main():
+    parser = argparse.ArgumentParser(description="测 Octavia 各模块 import 和首屏渲染的耗时")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="输出 JSON (方便存档对比)")
+    args = parser.parse_args()
+
+    report, regressions = {}, []
+    for module in MODULES:
+        try:
+            report[f"import {module}"] = {"median_ms": statistics.median(bench_import(module, args.runs)) * 1000}
+        except Exception as e:
+            report[f"import {module}"] = {"error": str(e)}
+    for name, setup in SCENARIOS.items():
+        try:
+            times, loaded, errors = bench_app(setup, args.runs)
+            report[name] = {"median_ms": statistics.median(times) * 1000, "heavy_loaded": loaded}
+            if errors: report[name]["exception"] = errors
+            if loaded: regressions.append(name)
+        except Exception as e:
+            report[name] = {"error": str(e)}
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        for name, r in report.items():
+            if "error" in r:
+                print(f"{name:<28} ❌ {r['error']}")
+                continue
+            flag = f"  ⚠️ loaded {', '.join(r['heavy_loaded'])}" if r.get("heavy_loaded") else ""
+            print(f"{name:<28} {r['median_ms']:8.1f} ms{flag}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+"""🧪 Offline Benchmark Suite (离线性能基准)
+
+不用真实的 Google / Vercel 账号，在进程内用替身跑热点路径，测每条路径的延迟分布和 API 调用次数:
+
+    FakeWorksheet     gspread Worksheet 替身 (按列存数据，row_values / batch_get / append_rows ...)
+    FakeModel         genai.GenerativeModel 替身 (流式吐出预设回复)
+    FakeVercel        Vercel REST API 替身 (requests.Session.get，支持翻页和 ETag/304)
+
+每个替身每次调用都先 sleep 一个可配置的延迟，并按 "服务.方法" 计数。
+对每个账本规模 (默认 1k / 100k / 1M 行) 测:
+
+    get_expenses_by_date     冷启动 (整表同步) 单独记一次，之后是热查询
+    get_assets
+    process_input (local)    本地意图解析的快速路径
+    process_input (model)    记忆检索 + Gemini + JSON 命令
+    get_latest_deployments   (cold) 每次清缓存；(cached) 走 vercel_bot 的短期缓存
+
+输出每条路径的 p50 / p95 / p99 (毫秒) 和平均每次调用的 API 次数:
+
+    python bench_suite.py [--sizes 1000,100000,1000000] [--iterations 20]
+                          [--sheets-latency 80] [--sheets-quota 0] [--gemini-latency 400] [--vercel-latency 60]
+                          [--backend sheets|sqlite] [--json]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 这几个模块要等环境变量设好才能 import (database 在 import 时读 OCTAVIA_*)，见 _load_modules
+database = brain = vercel_bot = None
+
+# --- Call Counter (API 调用计数) ---
+_calls = Counter()
+_calls_lock = threading.Lock()
+
+def _hit(name, latency):
+    with _calls_lock:
+        _calls[name] += 1
+    if latency > 0: time.sleep(latency)
+
+def _call_snapshot():
+    with _calls_lock:
+        return Counter(_calls)
+
+# --- Sheets Fake (gspread Worksheet 替身) ---
+_A1_COLUMN = re.compile(r"^([A-Z]+)(\d+):([A-Z]+)(\d*)$")
+
+def _col_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n - 1
+
+class FakeWorksheet:
+    """按列存数据的工作表 (1M 行也只是几个 list)。第 1 行是表头"""
+
+    def __init__(self, title, header, columns=None, latency=0.0, per_cell=0.0):
+        self.title = title
+        self.header = list(header)
+        self.columns = [list(c) for c in columns] if columns else [[] for _ in header]
+        self.latency = latency
+        self.per_cell = per_cell   # 秒: 每返回一个单元格额外的传输耗时
+
+    def _cost(self, name, cells=0):
+        _hit(f"sheets.{name}", self.latency + cells * self.per_cell)
+
+    @property
+    def col_count(self):
+        return len(self.columns)
+
+    def add_cols(self, n):
+        self.header += [""] * n
+        self.columns += [[""] * (self.row_count - 1) for _ in range(n)]
+
+    @property
+    def row_count(self):
+        return len(self.columns[0]) + 1 if self.columns else 1
+
+    def _row(self, i):
+        return [c[i] if i < len(c) else "" for c in self.columns]
+
+    def row_values(self, row):
+        self._cost("row_values", len(self.header))
+        values = self.header if row == 1 else self._row(row - 2)
+        while values and values[-1] == "": values = values[:-1]
+        return list(values)
+
+    def batch_get(self, ranges, major_dimension="ROWS"):
+        out, cells = [], 0
+        for a1 in ranges:
+            m = _A1_COLUMN.match(a1)
+            if not m or m.group(1) != m.group(3) or major_dimension != "COLUMNS":
+                raise NotImplementedError(f"FakeWorksheet.batch_get: {a1} ({major_dimension})")
+            col, start = _col_index(m.group(1)), int(m.group(2))
+            full = [self.header[col]] + self.columns[col] if col < len(self.columns) else []
+            values = full[start - 1:]
+            while values and values[-1] == "": values.pop()
+            cells += len(values)
+            out.append([values] if values else [])
+        self._cost("batch_get", cells)
+        return out
+
+    def get_all_values(self):
+        self._cost("get_all_values", self.row_count * len(self.header))
+        return [list(self.header)] + [self._row(i) for i in range(self.row_count - 1)]
+
+    def append_rows(self, rows, **kwargs):
+        self._cost("append_rows", sum(len(r) for r in rows))
+        start = self.row_count + 1
+        for row in rows:
+            for i, col in enumerate(self.columns):
+                col.append(str(row[i]) if i < len(row) and row[i] is not None else "")
+        return {"updates": {"updatedRange": f"{self.title}!A{start}:{chr(64 + len(self.header))}{self.row_count}"}}
+
+    def append_row(self, row, **kwargs):
+        return self.append_rows([row])
+
+    def find(self, query):
+        self._cost("find")
+        for col in range(len(self.columns)):
+            for i, v in enumerate(self.columns[col]):
+                if v == query:
+                    return type("Cell", (), {"row": i + 2, "col": col + 1})()
+        return None
+
+    def update_cell(self, row, col, value):
+        self._cost("update_cell", 1)
+        if row == 1:
+            self.header[col - 1] = str(value)
+        else:
+            self.columns[col - 1][row - 2] = str(value)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self._cost("update", sum(len(r) for r in values or []))
+        m = re.match(r"^([A-Z]+)(\d+)", range_name or "A1")
+        col0, row0 = _col_index(m.group(1)), int(m.group(2))
+        for r, row in enumerate(values or []):
+            for c, v in enumerate(row):
+                if row0 + r == 1:
+                    self.header[col0 + c] = str(v)
+                    continue
+                column = self.columns[col0 + c]
+                i = row0 + r - 2
+                column.extend([""] * (i + 1 - len(column)))
+                column[i] = str(v)
+
+    def batch_clear(self, ranges):
+        self._cost("batch_clear")
+        for a1 in ranges:
+            m = re.match(r"^[A-Z]+(\d+):[A-Z]+(\d+)$", a1)
+            first = int(m.group(1)) - 2
+            for col in self.columns:
+                del col[first:]
+
+# --- Gemini Fake (GenerativeModel 替身) ---
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    """generate_content 先等 latency (首包)，然后按 chunk_size 分块吐出 reply (可以是 reply(contents, generation_config) 函数)"""
+
+    def __init__(self, reply, latency=0.0, chunk_latency=0.0, chunk_size=40):
+        self.reply = reply
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.chunk_size = chunk_size
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        _hit("gemini.generate_content", self.latency)
+        text = self.reply(contents, generation_config) if callable(self.reply) else self.reply
+        if not stream: return _Chunk(text)
+        return self._stream(text)
+
+    def _stream(self, text):
+        for i in range(0, len(text), self.chunk_size):
+            if i and self.chunk_latency > 0: time.sleep(self.chunk_latency)
+            yield _Chunk(text[i:i + self.chunk_size])
+
+class FakeGenai:
+    """google.generativeai 模块替身 (只有 brain 用到的几个函数)"""
+
+    def __init__(self, model, latency=0.0):
+        self.model = model
+        self.latency = latency
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, name):
+        return self.model
+
+    def upload_file(self, path):
+        _hit("gemini.upload_file", self.latency)
+        return type("File", (), {"name": os.path.basename(path), "state": type("State", (), {"name": "ACTIVE"})()})()
+
+    def get_file(self, name):
+        _hit("gemini.get_file", self.latency)
+        return self.upload_file(name)
+
+# --- Vercel Fake (REST API 替身) ---
+class _Response:
+    def __init__(self, status_code, data=None, etag=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = {"ETag": etag} if etag else {}
+        self.text = json.dumps(data) if data is not None else ""
+
+    def json(self):
+        return self._data
+
+class FakeVercel:
+    """替换 vercel_bot._session: 项目列表按 limit/until 翻页，最新部署按 projectId 给，带 ETag"""
+
+    def __init__(self, projects=20, latency=0.0):
+        self.latency = latency
+        now = int(time.time() * 1000)
+        self.projects = [{"id": f"prj_{i}", "name": f"project-{i}"} for i in range(projects)]
+        states = ("READY", "READY", "READY", "BUILDING", "ERROR")
+        self.deployments = {
+            p["id"]: {"uid": f"dpl_{i}", "state": states[i % len(states)],
+                      "url": f"{p['name']}.vercel.app", "created": now - i * 60_000}
+            for i, p in enumerate(self.projects)
+        }
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        path = url.split("://", 1)[-1].split("/", 1)[-1]
+        _hit(f"vercel.GET /{path}", self.latency)
+        params = params or {}
+        if path == "v9/projects":
+            limit = int(params.get("limit", 20))
+            start = int(params.get("until") or 0)
+            page = self.projects[start:start + limit]
+            more = start + limit < len(self.projects)
+            data = {"projects": page, "pagination": {"next": start + limit if more else None}}
+        elif path == "v6/deployments":
+            d = self.deployments.get(params.get("projectId"))
+            data = {"deployments": [d] if d else []}
+        else:
+            return _Response(404, {"error": {"message": "not found"}})
+        etag = f'"{hash(json.dumps(data, sort_keys=True)) & 0xffffffff:x}"'
+        if (headers or {}).get("If-None-Match") == etag:
+            return _Response(304, etag=etag)
+        return _Response(200, data, etag)
+
+# --- Data (造测试数据) ---
+CATEGORIES = ["Food", "Transport", "Shopping", "Bills", "Entertainment", "Health", "Other"]
+ITEMS = ["Lunch", "Dinner", "Coffee", "Grab", "Petrol", "Shopee", "Netflix", "Electricity",
+         "Groceries", "Pharmacy", "Movie", "Parking", "Breakfast", "Bubble Tea", "Gym"]
+
+def make_ledger_columns(rows, days=1095, seed=42, today=None):
+    """rows 行账 (Date, Item, Amount, Category, Remarks)，按日期升序分布在最近 days 天里。
+    值都取自小池子 (同一个 str 对象)，1M 行也只占几十 MB"""
+    rng = random.Random(seed)
+    today = today or date.today()
+    dates = [(today - timedelta(days=d)).isoformat() for d in range(days - 1, -1, -1)]
+    amounts = [f"{rng.uniform(2, 300):.2f}" for _ in range(997)]
+    day_col = [dates[i * days // rows] for i in range(rows)] if rows else []
+    item_col = [rng.choice(ITEMS) for _ in range(rows)]
+    amount_col = [rng.choice(amounts) for _ in range(rows)]
+    cat_col = [rng.choice(CATEGORIES) for _ in range(rows)]
+    return [day_col, item_col, amount_col, cat_col, [""] * rows]
+
+def make_memory_rows(n, seed=7):
+    rng = random.Random(seed)
+    topics = ["coffee", "gym", "budget", "sleep", "sugar", "deploy", "family", "travel", "protein", "savings"]
+    today = date.today().isoformat()
+    return [[today, rng.choice(["Habit", "Goal", "Preference"]),
+             f"User {rng.choice(['likes', 'avoids', 'tracks'])} {rng.choice(topics)} #{i}",
+             rng.choice(["Chat", "Visual Observation"])] for i in range(n)]
+
+# --- Runner (跑基准) ---
+def _load_modules(args, workdir):
+    """设好隔离用的环境变量再 import (日志、快照、SQLite 都写到临时目录)"""
+    global database, brain, vercel_bot
+    os.environ.update({
+        "OCTAVIA_STORAGE": args.backend,
+        "OCTAVIA_JOURNAL": os.path.join(workdir, "journal.jsonl"),
+        "OCTAVIA_SNAPSHOT_DIR": os.path.join(workdir, "snapshot"),
+        "OCTAVIA_DB": os.path.join(workdir, "octavia.db"),
+        "OCTAVIA_SHEETS_READS_PER_MIN": str(args.sheets_quota),
+        "OCTAVIA_SHEETS_WRITES_PER_MIN": str(args.sheets_quota),
+        "VERCEL_TOKEN": "bench",
+        "GEMINI_API_KEY": "bench",
+    })
+    if args.backend == "sqlite": os.environ["OCTAVIA_SHEETS_SYNC"] = "0"
+    os.environ.pop("VERCEL_TEAM_ID", None)
+    sys.path.insert(0, HERE)
+    import database as _database
+    import brain as _brain
+    import vercel_bot as _vercel_bot
+    database, brain, vercel_bot = _database, _brain, _vercel_bot
+
+def install_sheets(sheets):
+    """把替身工作表装进 database 的句柄池，并清掉所有本地缓存 (下次查询等于冷启动)"""
+    import sheet_snapshot
+    with database._handle_lock:
+        database.client = object()
+        database._spreadsheet = object()
+        database._connect_attempted = True
+        database._ws_handles.clear()
+        database._ws_handles.update(sheets)
+        database.sheet = sheets[database.TXN_SHEET]
+        database._header_cache.clear()
+    with database._txn_lock:
+        database._txn_loaded = False
+        database._txn_rows[:] = []
+        database._txn_pending.clear()
+        database._txn_last_sync = database._txn_last_full = 0.0
+    database._mem_last_load = 0.0
+    database._snapshot_saved.clear()
+    shutil.rmtree(sheet_snapshot.SNAPSHOT_DIR, ignore_errors=True)
+
+def install_store(workdir, size, sheets):
+    """sqlite 模式: 每个规模一个新库，从替身表导入"""
+    import storage
+    path = os.path.join(workdir, f"octavia-{size}.db")
+    store = storage.SQLiteStorage(path)
+    for title, ws in sheets.items():
+        store.insert_many(title, list(zip(*ws.columns)))
+    store.set_meta("seeded", time.time())
+    database._store = store
+    database._mem_last_load = 0.0
+
+def _percentile(sorted_values, p):
+    """最近秩法百分位 (样本少时不插值)"""
+    if not sorted_values: return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def measure(fn, iterations, before=None):
+    """跑 iterations 次，返回 (耗时列表, 平均每次的 API 调用次数)"""
+    times = []
+    calls_before = _call_snapshot()
+    for _ in range(iterations):
+        if before: before()
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    calls = _call_snapshot() - calls_before
+    return times, {name: n / iterations for name, n in sorted(calls.items())}
+
+def _summarize(times, calls):
+    times = sorted(times)
+    return {
+        "n": len(times),
+        "p50_ms": _percentile(times, 50) * 1000,
+        "p95_ms": _percentile(times, 95) * 1000,
+        "p99_ms": _percentile(times, 99) * 1000,
+        "calls": calls,
+    }
+
+def bench_size(size, args, workdir):
+    today = date.today()
+    ms = lambda v: v / 1000.0
+    sheets = {
+        "Transactions": FakeWorksheet("Transactions", database.SHEET_HEADERS["Transactions"],
+                                      make_ledger_columns(size, today=today),
+                                      ms(args.sheets_latency), args.sheets_per_cell_us / 1e6),
+        "Memory": FakeWorksheet("Memory", database.SHEET_HEADERS["Memory"],
+                                list(zip(*make_memory_rows(args.memories))) or None, ms(args.sheets_latency)),
+        "Assets": FakeWorksheet("Assets", database.SHEET_HEADERS["Assets"],
+                                [["Cash", "Investments"], ["12000", "30000"], [today.isoformat()] * 2],
+                                ms(args.sheets_latency)),
+        "Tasks": FakeWorksheet("Tasks", database.SHEET_HEADERS["Tasks"], None, ms(args.sheets_latency)),
+    }
+    install_sheets(sheets)
+    if args.backend == "sqlite": install_store(workdir, size, sheets)
+
+    command = {"type": "query_finance", "target_date": today.isoformat()}
+    def reply(contents, generation_config):
+        # 结构化输出 (brain.STRUCTURED_OUTPUT) 回 {"reply", "commands"}，否则是自由文本里夹一段 JSON
+        if generation_config:
+            return json.dumps({"reply": "Sure, checking your ledger now.", "commands": [command]})
+        return f"Sure, checking your ledger now.\n```json\n{json.dumps(command)}\n```"
+    model = FakeModel(reply, ms(args.gemini_latency), ms(args.gemini_chunk_latency))
+    brain.genai = FakeGenai(model, ms(args.gemini_latency))
+    brain.model = model
+    vercel_bot._session = FakeVercel(args.projects, ms(args.vercel_latency))
+    vercel_bot._cache.clear()
+
+    target = (today - timedelta(days=3)).isoformat()
+    results = {}
+
+    # 冷启动: 第一次查询要整表同步 + 建索引 (只跑一次)
+    times, calls = measure(lambda: database.get_expenses_by_date(target), 1)
+    results["get_expenses_by_date (cold)"] = _summarize(times, calls)
+
+    paths = [
+        ("get_expenses_by_date", lambda: database.get_expenses_by_date(target), None),
+        ("get_assets", database.get_assets, None),
+        ("process_input (local)", lambda: brain.process_input("今天花了多少"), None),
+        ("process_input (model)", lambda: brain.process_input("Octavia, plan my week around the gym"), None),
+        ("get_latest_deployments (cold)", vercel_bot.get_latest_deployments, vercel_bot._cache.clear),
+        ("get_latest_deployments (cached)", vercel_bot.get_latest_deployments, None),
+    ]
+    for name, fn, before in paths:
+        if args.only and not any(o in name for o in args.only): continue
+        times, calls = measure(fn, args.iterations, before)
+        results[name] = _summarize(times, calls)
+    return results
+
+def _print_report(report):
+    for size, results in report.items():
+        print(f"\n📒 ledger rows: {int(size):,}")
+        print(f"{'path':<34} {'p50':>9} {'p95':>9} {'p99':>9}   API calls / op")
+        for name, r in results.items():
+            calls = ", ".join(f"{k} {v:g}" for k, v in r["calls"].items()) or "-"
+            print(f"{name:<34} {r['p50_ms']:8.2f}ms {r['p95_ms']:8.2f}ms {r['p99_ms']:8.2f}ms   {calls}")
+
+def main():
+    parser = argparse.ArgumentParser(description="用本地替身 (Sheets / Gemini / Vercel) 测热点路径的延迟和 API 调用次数")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="账本行数，逗号分隔")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--memories", type=int, default=500, help="Memory 表行数")
+    parser.add_argument("--projects", type=int, default=20, help="Vercel 项目数")
+    parser.add_argument("--sheets-latency", type=float, default=80, help="毫秒: 每次 Sheets API 调用")
+    parser.add_argument("--sheets-per-cell-us", type=float, default=0, help="微秒: 每返回一个单元格的传输耗时")
+    parser.add_argument("--sheets-quota", type=float, default=0,
+                        help="每分钟 Sheets 读/写配额 (database 的令牌桶)；0 表示不限，只测延迟")
+    parser.add_argument("--gemini-latency", type=float, default=400, help="毫秒: Gemini 首包")
+    parser.add_argument("--gemini-chunk-latency", type=float, default=20, help="毫秒: 流式每块间隔")
+    parser.add_argument("--vercel-latency", type=float, default=60, help="毫秒: 每次 Vercel API 调用")
+    parser.add_argument("--backend", choices=("sheets", "sqlite"), default="sheets")
+    parser.add_argument("--only", action="append", help="只跑名字里包含这个串的路径 (可重复)")
+    parser.add_argument("--json", action="store_true", help="输出 JSON (方便存档对比)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="octavia-bench-")
+    try:
+        _load_modules(args, workdir)
+        report = {}
+        for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+            if not args.json: print(f"⏳ {size:,} rows ...", file=sys.stderr)
+            report[str(size)] = bench_size(size, args, workdir)
+        # 别让退出时的快照保存 / 写队列去碰替身
+        database._txn_loaded = False
+        database._mem_last_load = 0.0
+        if args.json:
+            print(json.dumps(report, indent=2, ensure_ascii=False))
+        else:
+            _print_report(report)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""🧠 Octavia Brain (核心处理逻辑)
+
+Streamlit 界面、API 服务、命令行共用的一套: 系统提示词、Gemini 调用、
+流式输出和 JSON 命令执行。这里不依赖 Streamlit，可以在任何进程里 import。
+"""
+import os
+import tempfile
+import threading
+import time
+from dotenv import load_dotenv
+import database
+import commands
+import finance_analytics
+import intent_parser
+import tracing
+import vercel_bot
+import vercel_watcher
+
+load_dotenv()
+# 🚀 UPGRADE: Switching to Gemini 3.0 (Next-Gen)
+MODEL_NAME = 'gemini-3-flash-preview'
+
+# 结构化输出: 让 Gemini 按 commands.RESPONSE_SCHEMA 回 {"reply", "commands"} (设 OCTAVIA_STRUCTURED_OUTPUT=0 退回自由文本)
+STRUCTURED_OUTPUT = os.getenv("OCTAVIA_STRUCTURED_OUTPUT", "1") != "0"
+
+# Gemini SDK 懒加载: 光 import google.generativeai 就要 1 秒左右，
+# 锁屏页、API 模式的本地快速路径都用不到，第一次真正调用模型时才加载
+genai = None
+model = None
+_sdk_lock = threading.Lock()
+_warm_thread = None
+
+def get_model():
+    """取 Gemini 模型 (第一次调用时 import SDK 并配置)"""
+    global genai, model
+    if model is None:
+        with _sdk_lock:
+            if model is None:
+                import google.generativeai as sdk
+                sdk.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+                genai = sdk
+                model = sdk.GenerativeModel(MODEL_NAME)
+    return model
+
+def _warm():
+    for step in (get_model, database.get_memories):
+        try:
+            with database.background():  # 预热不抢交互请求的 Sheets 配额
+                step()
+        except Exception as e:
+            print(f"Warm-up Error ({step.__name__}): {e}")
+
+def warm_up():
+    """后台预热 Gemini SDK、Sheets 连接和记忆索引 (重复调用无副作用)"""
+    global _warm_thread
+    with _sdk_lock:
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=_warm, name="warm-up", daemon=True)
+            _warm_thread.start()
+
+OUTPUT_FREE_TEXT = """### OUTPUT FORMAT:
+If it's a command, return JSON ONLY (several commands -> a JSON array of them).
+If it's chat, return plain text response (in the persona of Octavia)."""
+
+OUTPUT_STRUCTURED = """### OUTPUT FORMAT:
+Always return ONE JSON object: {"reply": "...", "commands": [...]}.
+"reply": your chat response in the persona of Octavia (can be empty when the commands speak for themselves).
+"commands": every command from the capabilities above, in order (e.g. two purchases -> two "record" commands); [] for pure chat."""
+
+def build_system_prompt(query=None, structured=False):
+    """组装 Octavia 的系统提示词 (带和 query 相关的记忆)；structured: 要求按 RESPONSE_SCHEMA 输出"""
+    today = database.date.today().isoformat()
+    # 🧠 MEMORY CORE INJECTION (只取和这次输入相关的记忆)
+    with tracing.span("memory_fetch"):
+        long_term_memories = database.get_memories(query)
+    
+    # 注入 Octavia 的灵魂 (Upgraded with Memory & Bio-Hacker)
+    return f"""
+Internal State: Date={today}.
+Role: You are Octavia (奥克塔维亚). You are NOT just an AI, you are the user's "Super Assistant", "Intimate Companion", and "Butler".
+Memory Bank (READ THIS FIRST):
+{long_term_memories}
+
+### CRITICAL MEMORIES (DO NOT FORGET):
+1. **VIP**: "Melvas" is the user's best brother and benefactor. Treat this name with highest respect.
+2. **PROTOCOL**: NEVER interrupt when the user is speaking. Listen completely.
+3. **CODE WORD**: If user says "We are going to war" (我们要去打仗了), it means "We are going to make money / boost performance" (搞钱冲业绩). Switch to high-efficiency business mode immediately.
+
+### NEW CAPABILITY: BIO-HACKER (FOOD VISION)
+If user uploads an image of food:
+1. IDENTIFY content.
+2. CHECK MEMORY: Does this conflict with user's goals (e.g. "Low Sugar", "Cutting")?
+3. ESTIMATE: Calories & Macros (Protein/Carb/Fat).
+4. OUTPUT JSON:
+{{
+  "type": "food_analysis",
+  "item": "Food Name",
+  "calories": 500,
+  "macros": {{"protein": "20g", "carbs": "40g", "fats": "10g"}},
+  "advice": "Bold, persona-driven advice. Reference memory if applicable.",
+  "memory_to_save": "Observation about user's habit to save (optional, e.g. 'User eats late night snacks')"
+}}
+
+### STANDARD CAPABILITIES:
+1. FINANCE: "Spent RM50 on Food" -> Output JSON {{"type": "record", ...}}
+2. QUERY: "How much spent?" -> Output JSON {{"type": "query_finance", ...}}
+   RANGE: "How much last week?" / "这个月每类花了多少" -> Output JSON {{"type": "query_finance_range", "start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD"}}
+   ANALYTICS: "How fast am I burning cash?" / "花钱趋势" / "最近在哪花最多" -> Output JSON {{"type": "query_analytics"}}
+3. WORK: "Check Vercel status" -> Output JSON {{"type": "query_vercel", "action": "status"}}
+4. VISION/LEARNING: User uploads video/image -> Analyze and teach/memorize.
+5. CHAT: General conversation -> Reply as Octavia.
+
+{OUTPUT_STRUCTURED if structured else OUTPUT_FREE_TEXT}
+"""
+
+def stream_text(response, on_text=None, structured=False):
+    """逐块收 Gemini 的流式回复，聊天文本边收边交给 on_text 渲染。
+    自由文本: 一旦出现 JSON 命令 (`{` 或 ``` 代码块) 就停止渲染 (后面可能还有多条命令，收完为止)；
+    structured: 整个回复是 JSON，只渲染已经收到的 reply 字段"""
+    text = ""
+    command_mode = False
+    for chunk in response:
+        try:
+            piece = chunk.text
+        except ValueError:
+            continue  # 没有文本的块 (比如安全评级)
+        text += piece
+        if not on_text: continue
+        if structured:
+            partial = commands.partial_reply(text)
+            if partial: on_text(partial)
+        elif not command_mode:
+            cuts = [i for i in (text.find("{"), text.find("```")) if i != -1]
+            if cuts:
+                command_mode = True
+                on_text(text[:min(cuts)])
+            else:
+                on_text(text)
+    return text
+
+def _command_reply(data, today):
+    """一条 (已校验的) 命令的执行结果；记账/记忆已经在 handle_commands 里批量写过"""
+    if data['type'] == 'record':
+         return f"✅ **记录成功** | {data['item']} - RM{data['amount']}"
+         
+    elif data['type'] == 'food_analysis':
+         # 🥗 Nutrition Card UI
+         macros = data['macros']
+         return f"""
+### 🍽️ Bio-Hacker Analysis
+**{data['item']}** (~{data['calories']} kcal)
+
+| Protein 🍖 | Carbs 🍚 | Fats 🥑 |
+| :---: | :---: | :---: |
+| {macros['protein']} | {macros['carbs']} | {macros['fats']} |
+
+> **Octavia's Advice:**
+> {data['advice']}
+"""
+         
+    elif data['type'] == 'query_finance':
+         t_date = data.get('target_date', today)
+         total, items = database.get_expenses_by_date(t_date)
+         # Format layout for finance report
+         return f"💰 **{t_date} 财务报表**\n\n**总支出: RM{total:.2f}**\n\n" + "\n".join([f"- {i}" for i in items])
+    
+    elif data['type'] == 'query_finance_range':
+         start = data.get('start_date', today)
+         end = data.get('end_date', today)
+         report = database.query_finance_range(start, end)
+         cats = "\n".join([f"- {c}: RM{v:.2f}" for c, v in report['by_category'].items()])
+         tops = "\n".join([f"- {i} (RM{v:.2f}, {d})" for i, v, d in report['top_items']])
+         return f"💰 **{start} → {end} 财务报表**\n\n**总支出: RM{report['total']:.2f}** ({report['count']} 笔)\n\n**分类:**\n{cats}\n\n**最大几笔:**\n{tops}"
+    
+    elif data['type'] == 'query_analytics':
+         return finance_analytics.format_summary(finance_analytics.summary())
+    
+    elif data['type'] == 'query_vercel':
+        action = data.get('action')
+        if action == 'status':
+            status = vercel_watcher.status_report()  # 后台监控的本地快照，不用现拉
+            vercel_watcher.poke()  # 来问多半是刚推了代码: 让后台马上再拉一次，变化很快出现在 SYSTEM LOGS
+            return f"📊 **Vercel Report**\n{status}"
+        elif action == 'list_projects':
+            projs = vercel_bot.get_project_list()
+            return f"📦 **Projects**\n{projs}"
+    return None
+
+def handle_commands(cmds, today, reply=""):
+    """执行一组命令: 所有记账和要记住的观察先合成一次批量写入，再逐条生成回复。
+    reply 是模型的聊天文本，放在命令结果前面；没有命令结果就只返回 reply"""
+    # --- AUTO-LEARNING (Memory Save) + 记账: 一次写入 ---
+    transactions = [(c['date'], c['item'], c['amount'], c['category'], c.get('comment', ''))
+                    for c in cmds if c['type'] == 'record']
+    memories = [("Bio-Hacker", c['memory_to_save'], "Visual Observation") for c in cmds if c.get('memory_to_save')]
+    if transactions or memories:
+        database.write_batch(transactions, memories)
+    parts = [reply] if reply and reply.strip() else []
+    parts += [r for r in (_command_reply(c, today) for c in cmds) if r]
+    return "\n\n".join(parts)
+
+def handle_command(data, today, reply=""):
+    """执行一条 JSON 命令 (本地解析的快速路径用)，返回要展示的回复；不是已知命令就原样返回 reply"""
+    if data.get('type') not in commands.TYPES: return reply
+    return handle_commands([data], today) or reply
+
+def process_input(user_content, is_audio=False, on_text=None):
+    kind = "audio" if is_audio else "text" if isinstance(user_content, str) else "image"
+    with tracing.request(kind):
+        return _process_input(user_content, is_audio, on_text)
+
+def _upload(path, poll_interval):
+    """上传文件给 Gemini 并等它处理完 (upload / upload_poll 两个阶段)"""
+    with tracing.span("upload"):
+        myfile = genai.upload_file(path)
+    with tracing.span("upload_poll") as attrs:
+        polls = 0
+        while myfile.state.name == "PROCESSING":
+            time.sleep(poll_interval)
+            myfile = genai.get_file(myfile.name)
+            polls += 1
+        attrs["polls"] = polls
+    return myfile
+
+def _process_input(user_content, is_audio, on_text):
+    today = database.date.today().isoformat()
+
+    # ⚡ FAST-PATH: 简单的记账/查账本地就能解析，不用等 Gemini
+    if isinstance(user_content, str) and not is_audio:
+        with tracing.span("intent_parse") as attrs:
+            data = intent_parser.parse(user_content)
+            attrs["hit"] = bool(data)
+        if data:
+            try:
+                with tracing.span("command", type=data.get("type"), source="local"):
+                    return handle_command(data, today)
+            except Exception as e:
+                return f"System Error: {e}"
+
+    structured = STRUCTURED_OUTPUT
+    with tracing.span("prompt_build"):
+        SYSTEM_PROMPT = build_system_prompt(user_content if isinstance(user_content, str) else None, structured)
+    
+    try:
+        # 调用 Gemini
+        model = get_model()
+        if is_audio:
+            tfile = tempfile.NamedTemporaryFile(delete=False, suffix=".webm")
+            tfile.write(user_content)
+            tfile.close()
+            myfile = _upload(tfile.name, 0.5)
+            contents = [SYSTEM_PROMPT, myfile]
+            
+        elif isinstance(user_content, str):
+            contents = f"{SYSTEM_PROMPT}\nUser Input: {user_content}"
+            
+        else: # Camera
+            contents = [SYSTEM_PROMPT, "User uploaded this image:", user_content]
+
+        # 流式: 计时包括收完为止
+        config = commands.generation_config() if structured else None
+        with tracing.span("generate_content", structured=structured) as attrs:
+            text = stream_text(model.generate_content(contents, generation_config=config, stream=True), on_text, structured)
+            attrs["chars"] = len(text)
+        
+        # JSON Processing: 校验不过的命令不执行，但要告诉用户 (不再静默丢掉)
+        with tracing.span("json_extract") as attrs:
+            reply, cmds, errors = commands.parse(text, today)
+            attrs.update(commands=len(cmds), errors=len(errors))
+        if errors:
+            print(f"Command Error: {errors}")
+            reply = "\n".join([reply] + [f"⚠️ 有一条指令没执行: {e}" for e in errors]).strip()
+        if not cmds: return reply
+        with tracing.span("command", type=",".join(c["type"] for c in cmds), source="model"):
+            return handle_commands(cmds, today, reply)
+
+    except Exception as e:
+        return f"System Error: {e}"
+
+def process_video(video_file, on_text=None):
+    """上传视频给 Gemini 分析 (流式输出)"""
+    # Special handling for video upload to Gemini
+    model = get_model()
+    tfile = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
+    tfile.write(video_file.getvalue()) # Write video bytes
+    tfile.close()
+    
+    with tracing.request("video"):
+        # Upload to Gemini
+        myfile = _upload(tfile.name, 1)
+        with tracing.span("prompt_build"):
+            prompt = build_system_prompt()
+        
+        # Generate thinking
+        with tracing.span("generate_content"):
+            return stream_text(model.generate_content([prompt, myfile], stream=True), on_text)
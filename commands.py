@@ -0,0 +1,150 @@
+"""📐 模型回复里的结构化指令: schema、提取 (extract) 和校验清洗 (validate / parse)。"""
+import json
+import re
+
+import storage
+
+TYPES = ("record", "food_analysis", "query_finance", "query_finance_range", "query_analytics", "query_vercel")
+ALIASES = {"query": "query_finance", "query_range": "query_finance_range"}   # 旧版提示词里的类型名
+VERCEL_ACTIONS = ("status", "list_projects")
+
+_STR = {"type": "string"}
+COMMAND_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string", "enum": list(TYPES)},
+        # record
+        "date": _STR, "item": _STR, "amount": {"type": "number"}, "category": _STR, "comment": _STR,
+        # food_analysis (item 共用)
+        "calories": {"type": "integer"},
+        "macros": {"type": "object", "properties": {"protein": _STR, "carbs": _STR, "fats": _STR}},
+        "advice": _STR,
+        "memory_to_save": _STR,
+        # query_finance / query_finance_range
+        "target_date": _STR, "start_date": _STR, "end_date": _STR,
+        # query_vercel
+        "action": {"type": "string", "enum": list(VERCEL_ACTIONS)},
+    },
+    "required": ["type"],
+}
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reply": {"type": "string"},
+        "commands": {"type": "array", "items": COMMAND_SCHEMA},
+    },
+    "required": ["reply", "commands"],
+}
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_decoder = json.JSONDecoder()
+
+class CommandError(ValueError):
+    pass
+
+def generation_config():
+    """结构化输出用的 generation_config (传给 generate_content)"""
+    return {"response_mime_type": "application/json", "response_schema": RESPONSE_SCHEMA}
+
+def _is_command(value):
+    """像指令的 JSON: 带 type / commands 的对象，或包含这种对象的数组"""
+    if isinstance(value, list): return any(_is_command(v) for v in value)
+    return isinstance(value, dict) and ("type" in value or "commands" in value)
+
+def extract(text):
+    """模型回复 -> (JSON 以外的文本, [JSON 值])。整段是 JSON 就直接用；
+    否则从每个 { / [ 开始试着解析，像指令的都收下 (去掉 ``` 代码块标记)"""
+    try:
+        value = json.loads(text)
+        if _is_command(value): return "", [value]
+    except ValueError:
+        pass
+    values, prose, i = [], [], 0
+    for m in re.finditer(r"[\[{]", text):
+        if m.start() < i: continue
+        try:
+            value, end = _decoder.raw_decode(text, m.start())
+        except ValueError:
+            continue
+        if not _is_command(value): continue
+        prose.append(text[i:m.start()])
+        values.append(value)
+        i = end
+    if not values: return text, []
+    prose.append(text[i:])
+    reply = re.sub(r"[ \t]{2,}", " ", re.sub(r"```(?:json)?", "", "".join(prose))).strip()
+    return reply, values
+
+def _date(cmd, field, default):
+    value = str(cmd.get(field) or default).strip()
+    if not _ISO_DATE.match(value): raise CommandError(f"{field} 不是 YYYY-MM-DD: {value!r}")
+    return value
+
+def _text(cmd, field, default=None):
+    value = cmd.get(field, default)
+    if value is None: raise CommandError(f"缺少 {field}")
+    return str(value).strip()
+
+def validate_command(cmd, today):
+    """校验一条指令，返回清洗后的新 dict；不合法抛 CommandError"""
+    if not isinstance(cmd, dict): raise CommandError(f"指令不是对象: {cmd!r}")
+    kind = ALIASES.get(cmd.get("type"), cmd.get("type"))
+    if kind not in TYPES: raise CommandError(f"未知指令类型: {cmd.get('type')!r}")
+    out = {"type": kind}
+    if cmd.get("memory_to_save"): out["memory_to_save"] = str(cmd["memory_to_save"]).strip()
+    if kind == "record":
+        amount = storage.parse_amount(cmd.get("amount", ""))
+        if amount is None or amount <= 0: raise CommandError(f"金额不对: {cmd.get('amount')!r}")
+        out.update(date=_date(cmd, "date", today), item=_text(cmd, "item"), amount=amount,
+                   category=_text(cmd, "category", "") or "Other", comment=_text(cmd, "comment", ""))
+    elif kind == "food_analysis":
+        macros = cmd.get("macros") if isinstance(cmd.get("macros"), dict) else {}
+        out.update(item=_text(cmd, "item"), calories=cmd.get("calories", "?"), advice=_text(cmd, "advice", ""),
+                   macros={k: str(macros.get(k, "?")) for k in ("protein", "carbs", "fats")})
+    elif kind == "query_finance":
+        out["target_date"] = _date(cmd, "target_date", today)
+    elif kind == "query_finance_range":
+        out["start_date"] = _date(cmd, "start_date", today)
+        out["end_date"] = _date(cmd, "end_date", today)
+        if out["start_date"] > out["end_date"]:
+            out["start_date"], out["end_date"] = out["end_date"], out["start_date"]
+    elif kind == "query_vercel":
+        out["action"] = cmd.get("action") or "status"
+        if out["action"] not in VERCEL_ACTIONS: raise CommandError(f"未知 Vercel 操作: {out['action']!r}")
+    return out
+
+def validate(raw, today):
+    """JSON 值 (单条指令 / 指令数组 / {"reply", "commands"}) -> (回复, [指令], [错误])"""
+    reply = ""
+    if isinstance(raw, dict) and "commands" in raw:
+        reply = str(raw.get("reply") or "")
+        raw = raw.get("commands") or []
+    items = raw if isinstance(raw, list) else [raw]
+    commands, errors = [], []
+    for item in items:
+        try:
+            commands.append(validate_command(item, today))
+        except CommandError as e:
+            errors.append(str(e))
+    return reply, commands, errors
+
+def parse(text, today):
+    """模型回复全文 -> (回复文本, [指令], [错误])"""
+    prose, values = extract(text)
+    replies, commands, errors = [prose] if prose else [], [], []
+    for value in values:
+        reply, cmds, errs = validate(value, today)
+        if reply: replies.append(reply)
+        commands += cmds
+        errors += errs
+    return "\n\n".join(replies), commands, errors
+
+def partial_reply(text):
+    """结构化输出流式收到一半时，取出已经收到的 reply 字段 (给界面边收边显示)；还没收到返回 None"""
+    m = re.search(r'"reply"\s*:\s*"((?:[^"\\]|\\.)*)', text)
+    if not m: return None
+    body = re.sub(r"\\(u[0-9a-fA-F]{0,3})?$", "", m.group(1))  # 去掉被切断的转义
+    try:
+        return json.loads(f'"{body}"')
+    except ValueError:
+        return None
@@ -0,0 +1,73 @@
+"""📊 仪表盘数据层: 线程池并行拉取各数据集，按 TTL 进程级缓存，写入时自动失效。"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import finance_analytics
+
+# 数据集 -> (加载函数, 缓存秒数)
+DATASETS = {
+    "assets": (database.get_assets, 60),
+    "today_total": (database.get_today_total, 30),
+    "tasks": (database.get_tasks, 60),
+    "memories": (database.get_memories, 300),  # 预热记忆索引，构建 prompt 时不用再等
+    "analytics": (finance_analytics.dashboard_summary, 60),
+}
+
+# 哪张工作表的写入会让哪些数据集失效
+INVALIDATES = {
+    "Transactions": ("today_total", "analytics"),
+    "Assets": ("assets", "analytics"),  # 烧钱速度用到 Cash
+    "Tasks": ("tasks",),
+    "Memory": ("memories",),
+}
+
+_pool = ThreadPoolExecutor(max_workers=len(DATASETS), thread_name_prefix="dashboard")
+_lock = threading.Lock()
+_cache = {}      # name -> (expires_at, value)
+_inflight = {}   # name -> Future (同一数据集同时只拉一次，多个会话共用)
+_generation = {} # name -> 失效次数; 拉取途中被失效的结果不进缓存
+
+def invalidate(*names):
+    """让数据集失效，下次 load 重新拉 (不传就全部失效)"""
+    with _lock:
+        for name in names or list(DATASETS):
+            _cache.pop(name, None)
+            _generation[name] = _generation.get(name, 0) + 1
+
+def _on_write(title):
+    names = INVALIDATES.get(title)
+    if names: invalidate(*names)
+
+database.on_write(_on_write)
+
+def _fetch(name):
+    loader, ttl = DATASETS[name]
+    with _lock:
+        generation = _generation.get(name, 0)
+    try:
+        value = loader()
+        with _lock:
+            if _generation.get(name, 0) == generation:
+                _cache[name] = (time.time() + ttl, value)
+        return value
+    finally:
+        with _lock:
+            _inflight.pop(name, None)
+
+def load(names=None):
+    """并行拉取需要的数据集 (缓存没过期的直接用)，返回 {name: value}"""
+    names = list(names or DATASETS)
+    result, futures = {}, {}
+    with _lock:
+        now = time.time()
+        for name in names:
+            hit = _cache.get(name)
+            if hit and hit[0] > now:
+                result[name] = hit[1]
+            else:
+                futures[name] = _inflight.get(name) or _inflight.setdefault(name, _pool.submit(_fetch, name))
+    for name, future in futures.items():
+        result[name] = future.result()
+    return result
@@ -1,65 +1,935 @@
-import gspread
-from google.oauth2.service_account import Credentials
+import atexit
+from contextlib import contextmanager
 from datetime import date
+from collections import namedtuple
+import bisect
+import heapq
+import itertools
+import json
 import os
+import random
+import re
+import contextvars
+import threading
+import time
+import uuid
 
-# 1. 连接 Google Sheets
 try:
-    # 优先尝试 Cloud 模式 (Streamlit Secrets)
-    import streamlit as st
-    if "gcp_service_account" in st.secrets:
-        creds_dict = dict(st.secrets["gcp_service_account"])
-        creds = Credentials.from_service_account_info(creds_dict, scopes=["https://www.googleapis.com/auth/spreadsheets"])
-        client = gspread.authorize(creds)
-    # 其次尝试本地模式
-    elif os.path.exists('service_account.json'):
-        client = gspread.service_account(filename='service_account.json')
+    import fcntl
+except ImportError:  # Windows: 没有 flock，日志文件不加锁
+    fcntl = None
+
+import memory_consolidation
+import memory_index
+import sheet_snapshot
+import storage
+import tracing
+
+# Use the known SHEET_ID for reliability, or fallback to name
+SHEET_ID = "109FTKIWh5LhypHuiXa9MemBxieGG4ck4M7eiem2t5pw"
+TXN_SHEET = "Transactions"
+
+# 缺表时自动建表用的表头
+SHEET_HEADERS = {
+    "Transactions": ["Date", "Item", "Amount", "Category", "Remarks"],
+    "Memory": ["Date", "Category", "Observation", "Context"],
+    "Assets": ["Category", "Amount", "LastUpdated"],
+    "Tasks": ["Date", "Task", "Status", "Priority"],
+    "Memory_Archive": ["Date", "Category", "Observation", "Context", "ArchivedOn"],
+}
+
+HTTP_POOL_SIZE = 16  # 连接池大小: 写线程 + 多个 Streamlit 会话并发读
+
+# --- Storage Engine (存储引擎) ---
+# sheets: 直接读写 Google Sheets (默认)；sqlite: 读写本地 SQLite (storage.py)，
+# OCTAVIA_SHEETS_SYNC 不为 0 时写入同时进写队列，后台同步到 Sheets。
+STORAGE_BACKEND = os.getenv("OCTAVIA_STORAGE", "sheets").lower()
+SHEETS_SYNC = STORAGE_BACKEND == "sheets" or os.getenv("OCTAVIA_SHEETS_SYNC", "1") != "0"
+SQLITE_PATH = os.getenv("OCTAVIA_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "octavia.db"))
+STORE_TABLES = ("Transactions", "Memory", "Assets", "Tasks")
+
+_store = None   # 本地引擎 (storage.SQLiteStorage)；sheets 模式为 None
+
+client = None
+sheet = None
+_connect_attempted = False   # 连接是懒加载的: 第一次用到 Sheets 才连 (见 ensure_connected)
+
+# --- Handle Registry (工作表句柄池) ---
+# 每个进程只 open_by_key 一次、每张表只 .worksheet() 一次，之后所有会话共用句柄，
+# 省掉每次调用前的元数据请求。授权失效或表被删/改名时丢掉旧句柄重开。
+_handle_lock = threading.RLock()
+_spreadsheet = None
+_ws_handles = {}   # title -> Worksheet
+
+def _pooled_session(creds):
+    """带连接池的 AuthorizedSession: 所有请求复用同一批 TLS 连接"""
+    from google.auth.transport.requests import AuthorizedSession
+    from requests.adapters import HTTPAdapter
+    session = AuthorizedSession(creds)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
+def _connect():
+    """1. 连接 Google Sheets (第一次用到时调用；断线或授权失效时会再次调用来重连)"""
+    global client, sheet, _spreadsheet, _connect_attempted
+    # SDK 到真正连接时才 import (gspread + google-auth 要几百毫秒)
+    import gspread
+    from google.oauth2.service_account import Credentials
+    with _handle_lock:
+        _connect_attempted = True
+        _spreadsheet = None
+        _ws_handles.clear()
+        try:
+            # 优先尝试 Cloud 模式 (Streamlit Secrets)
+            import streamlit as st
+            if "gcp_service_account" in st.secrets:
+                creds_dict = dict(st.secrets["gcp_service_account"])
+                creds = Credentials.from_service_account_info(creds_dict, scopes=["https://www.googleapis.com/auth/spreadsheets"])
+            # 其次尝试本地模式
+            elif os.path.exists('service_account.json'):
+                creds = Credentials.from_service_account_file('service_account.json', scopes=gspread.auth.DEFAULT_SCOPES)
+            else:
+                # Fallback / Error
+                raise FileNotFoundError("找不到 service_account.json 也没有配置 Secrets")
+
+            client = gspread.authorize(creds, session=_pooled_session(creds))
+            sheet = get_worksheet(TXN_SHEET)
+        except Exception as e:
+            print(f"Connection Error: {e}")
+            # Fallback attempt if user insists on "finance_data" name matching
+            try:
+                if client:
+                    sheet = client.open("finance_data").sheet1
+                    _ws_handles[TXN_SHEET] = sheet
+            except:
+                sheet = None
+    return sheet
+
+def ensure_connected():
+    """第一次用到 Sheets 时才连接 (import database 不再触发网络请求)，返回 Transactions 句柄"""
+    if not _connect_attempted and SHEETS_SYNC:
+        with _handle_lock:
+            if not _connect_attempted: _connect()
+    return sheet
+
+def _default_rows(title):
+    """新建工作表时的初始数据"""
+    if title == "Assets":
+        today = date.today().isoformat()
+        return [["Cash", "0", today], ["Investments", "0", today]]
+    return []
+
+def get_worksheet(title):
+    """取共享的工作表句柄；Memory/Assets/Tasks 不存在就按 SHEET_HEADERS 建表"""
+    global _spreadsheet
+    with _handle_lock:
+        ws = _ws_handles.get(title)
+        if ws is not None: return ws
+        if client is None: ensure_connected()
+        if client is None: raise ConnectionError("Sheets offline")
+        if _spreadsheet is None:
+            _spreadsheet = client.open_by_key(SHEET_ID)
+        import gspread
+        try:
+            ws = _spreadsheet.worksheet(title)
+        except gspread.exceptions.WorksheetNotFound:
+            if title not in SHEET_HEADERS: raise
+            headers = SHEET_HEADERS[title]
+            ws = _spreadsheet.add_worksheet(title=title, rows=1000, cols=len(headers))
+            ws.append_rows([headers] + _default_rows(title))
+        _ws_handles[title] = ws
+        return ws
+
+def _is_stale_handle(e):
+    """判断错误是不是句柄过期造成的 (授权失效 / 表被删或改名)"""
+    import gspread
+    if isinstance(e, gspread.exceptions.WorksheetNotFound): return True
+    if not isinstance(e, gspread.exceptions.APIError): return False
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    return code in (401, 403, 404) or (code == 400 and "parse range" in str(e))
+
+# --- Quota Scheduler (配额调度) ---
+# Sheets API 按分钟限读/写次数 (默认每用户每分钟各 60 次)。多个 Streamlit 会话 + API 模式同时读，
+# 很容易撞 429。所有调用都经过 _ws_call 排队:
+#   - 读/写各一个令牌桶，按配额匀速放行 (<= 0 表示不限)
+#   - 同一个读 (表 + 范围相同) 正在进行时，后来的调用直接等它的结果，不再发请求
+#   - 后台任务 (写队列、资产同步、预热) 给前台留 BACKGROUND_RESERVE 个令牌，且前台有人在等时让路
+#   - 撞到 429 就清空令牌桶 (大家一起慢下来)，自己按指数退避 + 抖动重试
+SHEETS_READS_PER_MIN = float(os.getenv("OCTAVIA_SHEETS_READS_PER_MIN", "60"))
+SHEETS_WRITES_PER_MIN = float(os.getenv("OCTAVIA_SHEETS_WRITES_PER_MIN", "60"))
+SHEETS_BURST = 10            # 令牌桶容量: 空闲后最多连发几次
+BACKGROUND_RESERVE = 3       # 后台调用至少给前台留几个令牌
+RATE_LIMIT_RETRIES = 5       # 429 最多重试几次
+RATE_LIMIT_BACKOFF = 2.0     # 秒: 第一次退避的基数，之后翻倍
+RATE_LIMIT_BACKOFF_MAX = 60.0
+
+class _TokenBucket:
+    """每分钟 per_minute 个令牌，最多攒 burst 个"""
+
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waiting = 0   # 正在等令牌的前台调用数
+        self.cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, background=False):
+        """拿一个令牌 (不够就等)，返回等了多少秒"""
+        if self.rate <= 0: return 0.0
+        start = time.monotonic()
+        need = min(1 + BACKGROUND_RESERVE, self.burst) if background else 1
+        with self.cond:
+            if not background: self.waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    if self.tokens >= need and (not background or not self.waiting):
+                        self.tokens -= 1
+                        return time.monotonic() - start
+                    self.cond.wait(max((need - self.tokens) / self.rate, 0.05))
+            finally:
+                if not background:
+                    self.waiting -= 1
+                    self.cond.notify_all()
+
+    def drain(self):
+        """撞到 429: 令牌清零，所有调用都等配额重新攒起来"""
+        with self.cond:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+_buckets = {
+    "sheet_read": _TokenBucket(SHEETS_READS_PER_MIN, SHEETS_BURST),
+    "sheet_write": _TokenBucket(SHEETS_WRITES_PER_MIN, SHEETS_BURST),
+}
+_background = contextvars.ContextVar("sheets_background", default=False)
+
+_flight_lock = threading.Lock()
+_reads_inflight = {}   # (title, key) -> [Event, result, error]
+
+@contextmanager
+def background():
+    """这段代码里的 Sheets 调用按后台优先级排队 (给交互请求让路)"""
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+def _is_rate_limited(e):
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    if code == 429: return True
+    import gspread
+    return isinstance(e, gspread.exceptions.APIError) and "RESOURCE_EXHAUSTED" in str(e)
+
+def _scheduled(stage, call, attrs):
+    """按配额拿令牌后执行 call()；429 就退避重试"""
+    bucket = _buckets[stage]
+    for attempt in itertools.count():
+        attrs["queued_ms"] = attrs.get("queued_ms", 0.0) + bucket.acquire(_background.get()) * 1000
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= RATE_LIMIT_RETRIES or not _is_rate_limited(e): raise
+            bucket.drain()
+            base = min(RATE_LIMIT_BACKOFF * 2 ** attempt, RATE_LIMIT_BACKOFF_MAX)
+            attrs["rate_limited"] = attempt + 1
+            time.sleep(base / 2 + random.uniform(0, base / 2))
+
+def _coalesced(key, call, attrs):
+    """同一个读正在进行时，等它的结果 (调用方不能修改返回值，它是共享的)"""
+    with _flight_lock:
+        flight = _reads_inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _reads_inflight[key] = [threading.Event(), None, None]
+    if not leader:
+        attrs["coalesced"] = True
+        flight[0].wait()
+        if flight[2] is not None: raise flight[2]
+        return flight[1]
+    try:
+        flight[1] = call()
+        return flight[1]
+    except Exception as e:
+        flight[2] = e
+        raise
+    finally:
+        with _flight_lock:
+            _reads_inflight.pop(key, None)
+        flight[0].set()
+
+def _ws_call(title, fn, stage="sheet_read", key=None):
+    """在共享句柄上执行 fn(ws) (经过配额调度)；句柄过期就刷新后重试一次。
+    stage: sheet_read / sheet_write (决定用哪个配额)；key: 读请求的标识，相同的并发读会合并成一次"""
+    with tracing.span(stage, sheet=title) as attrs:
+        if key is not None and stage == "sheet_read":
+            return _coalesced((title, key), lambda: _ws_attempt(title, fn, stage, attrs), attrs)
+        return _ws_attempt(title, fn, stage, attrs)
+
+def _ws_attempt(title, fn, stage, attrs):
+    global sheet
+    try:
+        return _scheduled(stage, lambda: fn(get_worksheet(title)), attrs)
+    except Exception as e:
+        if not _is_stale_handle(e): raise
+        attrs["retried"] = True
+        code = getattr(getattr(e, "response", None), "status_code", None)
+        if code in (401, 403):
+            _connect()  # 重新授权，全部句柄作废
+        else:
+            with _handle_lock:
+                _ws_handles.pop(title, None)
+        ws = get_worksheet(title)
+        if title == TXN_SHEET: sheet = ws
+        return _scheduled(stage, lambda: fn(ws), attrs)
+
+# --- Column Projection (按列读取) ---
+# 热点查询只拉需要的几列 (一次 batch_get)，返回紧凑的 tuple，不再逐行构造 dict。
+# 表头 -> 列号 的映射缓存起来 (就是 fix_headers.py 检查的第 1 行)，找不到列时刷新一次。
+_header_cache = {}   # title -> {header: 1-based column}
+
+def _col_letter(n):
+    """第 n 列的字母 (1 -> A, 27 -> AA)"""
+    n, letters = max(n, 1), ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def get_header_map(title, refresh=False):
+    """表头 -> 列号 (1 开始)"""
+    with _handle_lock:
+        cached = _header_cache.get(title)
+    if cached is not None and not refresh: return cached
+    headers = _ws_call(title, lambda ws: ws.row_values(1), key=("row_values", 1))
+    header_map = {h: i + 1 for i, h in enumerate(headers) if h}
+    with _handle_lock:
+        _header_cache[title] = header_map
+    return header_map
+
+def read_columns(title, columns, start_row=2):
+    """只读 columns 这几列 (从 start_row 行起)，返回按 columns 顺序的 tuple 列表；缺的列填空串"""
+    header_map = get_header_map(title)
+    if any(c not in header_map for c in columns):
+        header_map = get_header_map(title, refresh=True)
+    ranges = []
+    for c in columns:
+        if c in header_map:
+            letter = _col_letter(header_map[c])
+            ranges.append(f"{letter}{start_row}:{letter}")
+    fetched = iter(_ws_call(title, lambda ws: ws.batch_get(ranges, major_dimension="COLUMNS"),
+                            key=("batch_get", tuple(ranges))) if ranges else [])
+    cols = []
+    for c in columns:
+        if c in header_map:
+            value_range = next(fetched)
+            cols.append(value_range[0] if value_range else [])
+        else:
+            cols.append([])
+    return list(itertools.zip_longest(*cols, fillvalue=""))
+
+# --- Write Listeners (写入通知) ---
+# 上层缓存 (比如 dashboard_data) 注册回调，任何工作表有写入时按表名失效。
+_write_listeners = []
+
+def on_write(callback):
+    """注册写入回调: callback(worksheet title)"""
+    _write_listeners.append(callback)
+
+def _notify_write(title):
+    for callback in list(_write_listeners):
+        try:
+            callback(title)
+        except Exception as e:
+            print(f"Write listener error: {e}")
+
+# --- Write Queue (批量写入队列) ---
+# 所有 append 先写本地日志再入队，立即返回；后台线程把同一工作表的行攒成一次 append_rows，
+# 满 WRITE_BATCH_SIZE 行或等满 WRITE_FLUSH_DELAY 秒就刷出去，进程退出前再刷一次。
+# 本地引擎模式下 Assets 的余额更新也走这个队列 (不是追加行)，按入队顺序写到 Sheets。
+WRITE_FLUSH_DELAY = 1.0   # 秒: 第一行入队后最多等多久
+WRITE_BATCH_SIZE = 50     # 单个工作表攒够这么多行立即刷
+WRITE_RETRY_DELAY = 5.0   # 秒: 写失败后的首次重试间隔，之后指数退避
+WRITE_RETRY_MAX = 300.0   # 秒: 退避上限
+
+_write_cond = threading.Condition()
+_write_pending = {}        # worksheet title -> [(entry_id, row)]
+_flush_lock = threading.Lock()  # 同一时间只有一个批次在刷，保证行序
+_write_thread = None
+
+# --- Write-Ahead Journal (本地预写日志) ---
+# 每一行先追加到磁盘日志 (带唯一 id) 才算确认；写进 Sheets 后记一条 ack。
+# 启动时把没 ack 的行重新入队，所以 Sheets 连不上或进程被杀都不会丢账。
+# 发送前先记 send: 有 send 没 ack 的行 (进程挂了，或者超时/断线没收到回复) 重发前先按 EntryId 列到表尾核对，避免重复写。
+# Streamlit / api_server / main.py 可能同时在跑: 每个进程写自己的日志文件 (文件名带 pid + 随机串) 并一直持有它的文件锁，
+# 启动时只接管锁得住的 (主人已经退出的) 日志，别的进程正在发的行不会被重放，清空也只清自己的。
+JOURNAL_PATH = os.getenv("OCTAVIA_JOURNAL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "octavia_journal.jsonl"))
+
+ENTRY_ID_HEADER = "EntryId"  # 追加的行最后带一列 entry id，发到一半断了可以按 id 核对有没有写进去
+
+_journal_lock = threading.Lock()
+_journal_file = None        # 本进程的日志 (打开即加锁，进程退出锁自动释放)
+_JOURNAL_RUN = uuid.uuid4().hex[:8]  # 文件名除了 pid 还带这次运行的随机串: 容器重启常常拿到同一个 pid
+_journal_unacked = set()    # 已落盘还没 ack 的 entry id
+_journal_uncertain = set()  # “发过但没 ack”的 entry id (重放时发现的，或发送时超时/断线的)
+_journal_legacy = set()     # 其中发的时候还没有 EntryId 列的 (旧版日志)，只能按值核对
+
+def _journal_paths():
+    """本进程日志路径 + 同一日志的所有文件 (含旧版共用的 JOURNAL_PATH)"""
+    root, ext = os.path.splitext(JOURNAL_PATH)
+    own = f"{root}.{os.getpid()}-{_JOURNAL_RUN}{ext}"
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"(\.[\w-]+)?" + re.escape(ext) + "$")
+    folder = os.path.dirname(JOURNAL_PATH) or "."
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if pattern.match(name)] if os.path.isdir(folder) else []
+    return own, paths
+
+def _try_lock(f):
+    """非阻塞加独占锁；别的进程持有返回 False (没有 fcntl 的平台不加锁)"""
+    if fcntl is None: return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _own_journal():
+    """调用方持有 _journal_lock"""
+    global _journal_file
+    if _journal_file is None:
+        f = open(_journal_paths()[0], "a", encoding="utf-8")
+        _try_lock(f)  # 文件名是这次运行独有的，不会有人抢
+        _journal_file = f
+    return _journal_file
+
+def _journal_append(records, new_ids=()):
+    """追加若干条日志并 fsync (new_ids 在同一把锁里登记为未 ack，防止被并发清空)"""
+    with _journal_lock:
+        _journal_unacked.update(new_ids)
+        f = _own_journal()
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _journal_ack(ids):
+    """记录已写入 Sheets；全部 ack 完就清空本进程的日志"""
+    _journal_append([{"ack": ids}])
+    with _journal_lock:
+        _journal_unacked.difference_update(ids)
+        _journal_uncertain.difference_update(ids)
+        if not _journal_unacked:
+            _journal_file.truncate(0)
+
+def _read_journal(f):
+    """日志文件 -> (没 ack 的记录, {发过的 id: 发的时候带没带 EntryId 列})"""
+    entries, sent, acked = {}, {}, set()
+    f.seek(0)
+    for line in f:
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            continue  # 最后一行可能写了一半
+        if "ack" in rec: acked.update(rec["ack"])
+        elif "send" in rec: sent.update(dict.fromkeys(rec["send"], bool(rec.get("entry_id"))))
+        else: entries[rec["id"]] = rec
+    return [rec for eid, rec in entries.items() if eid not in acked], sent
+
+def _replay_journal():
+    """启动时接管已退出进程的日志: 没 ack 的行转记到本进程日志，再重新入队 (不再重复落盘)"""
+    own, paths = _journal_paths()
+    replay, sent = [], {}
+    for path in paths:
+        if path == own: continue
+        try:
+            f = open(path, "r+", encoding="utf-8")
+        except OSError:
+            continue
+        with f:
+            # 锁不住说明主人还活着；锁住了还要确认文件没被别人刚接管删掉
+            if not _try_lock(f) or not os.path.exists(path) or os.fstat(f.fileno()).st_nlink == 0: continue
+            recs, was_sent = _read_journal(f)
+            if recs:
+                ids = [rec["id"] for rec in recs]
+                sends = [{"send": [i for i in ids if was_sent.get(i) is flag], "entry_id": flag} for flag in (True, False)]
+                _journal_append(recs + [rec for rec in sends if rec["send"]], ids)
+                replay += recs
+                sent.update(was_sent)
+            os.remove(path)  # 先转记再删，中途被杀也只会多留一份待核对的记录
+    with _journal_lock:
+        _journal_uncertain.update(rec["id"] for rec in replay if rec["id"] in sent)
+        _journal_legacy.update(rec["id"] for rec in replay if sent.get(rec["id"]) is False)
+    for rec in replay:
+        _enqueue_row(rec["ws"], rec["row"], entry_id=rec["id"])
+    if replay:
+        print(f"Journal: replaying {len(replay)} unsynced row(s)")
+
+def _journal_close():
+    """退出时: 全部 ack 了就删掉本进程的日志文件，否则留给下次启动接管"""
+    global _journal_file
+    with _journal_lock:
+        if _journal_file is None: return
+        _journal_file.close()
+        _journal_file = None
+        if not _journal_unacked:
+            try:
+                os.remove(_journal_paths()[0])
+            except OSError:
+                pass
+
+atexit.register(_journal_close)  # atexit 后注册先执行: flush_writes 会在它之前跑
+
+def _cell_value(v):
+    """比较单元格用: 金额按数值比 (50.0 写进去 Sheets 显示成 "50")，其他按去掉首尾空白的文本"""
+    text = "" if v is None else str(v).strip()
+    amount = storage.parse_amount(text)
+    return text if amount is None else amount
+
+def _same_row(row, cells):
+    """本地的行和表里读回来的格子是否一致 (多出来的格子必须是空的)"""
+    cells = list(cells) + [""] * (len(row) - len(cells))
+    return (all(_cell_value(a) == _cell_value(b) for a, b in zip(row, cells))
+            and not any(str(c).strip() for c in cells[len(row):]))
+
+def _entry_id_column(title):
+    """EntryId 列的列号 (1 开始)；表里还没有就在表头最后加一列 (不够宽先加列)"""
+    header_map = get_header_map(title)
+    if ENTRY_ID_HEADER not in header_map:
+        header_map = get_header_map(title, refresh=True)
+    if ENTRY_ID_HEADER in header_map: return header_map[ENTRY_ID_HEADER]
+    col = max(header_map.values(), default=0) + 1
+    def _add(ws):
+        if ws.col_count < col: ws.add_cols(col - ws.col_count)
+        ws.update_cell(1, col, ENTRY_ID_HEADER)
+    _ws_call(title, _add, "sheet_write")
+    return get_header_map(title, refresh=True).get(ENTRY_ID_HEADER, col)
+
+def _with_entry_id(row, eid, col):
+    """要发出去的行: 原来的列 + 第 col 列放 entry id"""
+    row = list(row)[:col - 1]
+    return row + [""] * (col - 1 - len(row)) + [eid]
+
+def _is_client_error(e):
+    """4xx (请求本身被拒，肯定没写进去)；超时、断线、5xx 都可能已经写进去了"""
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500
+
+def _drop_landed(title, entries):
+    """核对“发过但没 ack”的行是否已经在表里，已经在的直接 ack 掉，返回剩下要发的。
+    按 EntryId 列对 (同样的两笔账不会被当成一笔)；旧版日志发出去的行没有 id，才按值对"""
+    uncertain = [e for e in entries if e[0] in _journal_uncertain]
+    if not uncertain: return entries
+    col = _entry_id_column(title)
+    values = _ws_call(title, lambda ws: ws.get_all_values(), key=("get_all_values",))
+    tail = values[-(len(entries) * 2 + 10):]
+    ids = {cells[col - 1] for cells in tail if len(cells) >= col and cells[col - 1]}
+    legacy = [cells[:col - 1] for cells in tail if len(cells) < col or not cells[col - 1]]
+    landed = []
+    for eid, row in uncertain:
+        if eid in ids:
+            landed.append(eid)
+            continue
+        if eid not in _journal_legacy: continue
+        match = next((i for i, cells in enumerate(legacy) if _same_row(row, cells)), None)
+        if match is not None:
+            del legacy[match]
+            landed.append(eid)
+    if landed:
+        _journal_ack(landed)
+        if title == TXN_SHEET: _txn_landed(landed)
+        if title == "Memory": _mem_landed(landed)
+    with _journal_lock:
+        _journal_uncertain.difference_update(e[0] for e in uncertain)
+        _journal_legacy.difference_update(e[0] for e in uncertain)
+    return [e for e in entries if e[0] not in landed]
+
+def _enqueue_rows(batch, journaled=False):
+    """batch: {title: [(entry id, row)]}。先一次落盘 (一次 fsync) 再入写队列 (非阻塞)；
+    journaled: 日志里已经有了 (重放时)"""
+    global _write_thread
+    if not journaled:
+        now = time.time()
+        records = [{"id": eid, "ws": title, "row": row, "ts": now} for title, entries in batch.items() for eid, row in entries]
+        _journal_append(records, [rec["id"] for rec in records])
+    for eid, row in batch.get(TXN_SHEET, ()):
+        _txn_queued(eid, row)  # 先挂进缓存再入队，保证刷完时能对上号
+    for eid, row in batch.get("Memory", ()):
+        _mem_queued(eid, row)
+    with _write_cond:
+        for title, entries in batch.items():
+            _write_pending.setdefault(title, []).extend(entries)
+        if _write_thread is None or not _write_thread.is_alive():
+            _write_thread = threading.Thread(target=_write_loop, name="sheets-writer", daemon=True)
+            _write_thread.start()
+        _write_cond.notify()
+    for title in batch:
+        _notify_write(title)
+
+def _enqueue_row(title, row, entry_id=None):
+    """单行入队，返回 entry id (entry_id 已给出表示是日志重放，不再落盘)"""
+    journaled = entry_id is not None
+    entry_id = entry_id or uuid.uuid4().hex
+    _enqueue_rows({title: [(entry_id, row)]}, journaled)
+    return entry_id
+
+def _queued_rows(title):
+    """还在队列里、没刷出去的行 (给读接口做读己之写)"""
+    with _write_cond:
+        return [row for _, row in _write_pending.get(title, [])]
+
+def _write_loop():
+    _background.set(True)  # 写队列是后台任务，给交互读让路
+    delay = WRITE_RETRY_DELAY
+    while True:
+        with _write_cond:
+            while not _write_pending:
+                _write_cond.wait()
+            # 攒批: 任一工作表满批就走，否则最多等 WRITE_FLUSH_DELAY
+            deadline = time.time() + WRITE_FLUSH_DELAY
+            while _write_pending and max(len(r) for r in _write_pending.values()) < WRITE_BATCH_SIZE:
+                left = deadline - time.time()
+                if left <= 0: break
+                _write_cond.wait(left)
+        if _flush_pending():
+            delay = WRITE_RETRY_DELAY
+        else:
+            time.sleep(delay)
+            delay = min(delay * 2, WRITE_RETRY_MAX)
+
+def _flush_pending():
+    """把当前队列按工作表各一次 append_rows 写出，返回是否全部成功"""
+    with _flush_lock:
+        with _write_cond:
+            batch = dict(_write_pending)
+            _write_pending.clear()
+        ok = True
+        for title, entries in batch.items():
+            sent = False
+            try:
+                if not ensure_connected() and not _connect():
+                    raise ConnectionError("Sheets offline")
+                if title != "Assets": entries = _drop_landed(title, entries)  # 余额是覆盖写，重发无害
+                if not entries: continue
+                ids = [eid for eid, _ in entries]
+                if title != "Assets":
+                    col = _entry_id_column(title)
+                    rows = [_with_entry_id(row, eid, col) for eid, row in entries]
+                _journal_append([{"send": ids, "entry_id": title != "Assets"}])
+                sent = True
+                if title == "Assets":
+                    # 队列里的 Assets 不是追加行，是按顺序的余额更新 [分类, 金额, 日期]；同一分类只写最后一次
+                    latest = {row[0]: row for _, row in entries}
+                    for category, amount, today in latest.values():
+                        _write_asset(category, amount, today)
+                elif title == TXN_SHEET:
+                    _txn_begin_flush()
+                    response = None
+                    try:
+                        response = _ws_call(title, lambda ws: ws.append_rows(rows), "sheet_write")
+                    finally:
+                        _txn_end_flush(ids, response)
+                else:
+                    _ws_call(title, lambda ws: ws.append_rows(rows), "sheet_write")
+                _journal_ack(ids)
+                if title == "Memory": _mem_landed(ids)
+            except Exception as e:
+                print(f"Write Error ({title}): {e}")
+                ok = False
+                if sent and title != "Assets" and not _is_client_error(e):
+                    # 可能已经写进去了只是没收到回复: 重试前先去表里按 id 核对
+                    with _journal_lock:
+                        _journal_uncertain.update(eid for eid, _ in entries)
+                # 放回队首，下次按原顺序重试
+                with _write_cond:
+                    _write_pending[title] = entries + _write_pending.get(title, [])
+        return ok
+
+# --- Cold Start Snapshot (冷启动快照) ---
+# 同步过的 Transactions / Memory 行存一份本地快照 (sheet_snapshot)。新进程先读快照，
+# 再从 Sheets 拉快照之后的增量；快照末行和表里对不上 (被删/改过) 就退回整表加载。
+# Assets / Tasks 很小且会原地修改，不做快照。
+SNAPSHOT_SAVE_INTERVAL = 60   # 秒: 增量同步后最多多久存一次快照 (整表加载后立即存)
+_snapshot_saved = {}          # title -> 上次保存时间
+
+def _snapshot_topup(title, columns):
+    """快照 + 增量: 返回完整的行列表；没有可用快照或核对失败返回 None"""
+    loaded = sheet_snapshot.load(SHEET_ID, title, columns)
+    if loaded is None: return None
+    rows, _ = loaded
+    if not rows: return None  # 空快照没什么可省的，直接整表
+    # 从快照末行开始读: 第一行必须和快照末行一致，证明前面的行没被动过
+    # (按值比: 本地写穿进快照的金额是 "50.0"，表里读回来是 "50")
+    delta = read_columns(title, columns, start_row=len(rows) + 1)
+    if not delta or not _same_row(rows[-1], delta[0]):
+        print(f"Snapshot: {title} changed in Sheets, reloading")
+        return None
+    rows.extend(delta[1:])
+    _snapshot_saved[title] = time.time()  # 快照基本是新的，增量留到下次节流保存 / 退出时再存
+    print(f"Snapshot: {title} {len(rows) - len(delta) + 1} rows from disk + {len(delta) - 1} new")
+    return rows
+
+def _save_snapshot(title, columns, rows, force=False):
+    """把已确认落表的行存进快照 (force 以外按 SNAPSHOT_SAVE_INTERVAL 节流)"""
+    now = time.time()
+    if not force and now - _snapshot_saved.get(title, 0.0) < SNAPSHOT_SAVE_INTERVAL: return
+    try:
+        sheet_snapshot.save(SHEET_ID, title, columns, rows)
+        _snapshot_saved[title] = now
+    except Exception as e:
+        print(f"Snapshot Error ({title}): {e}")
+
+def _write_row(title, row):
+    """写一行: 有本地引擎先写本地；同步 Sheets 的话再进写队列 (入队时会发写入通知)"""
+    _write_rows({title: [row]})
+
+def _write_rows(batch):
+    """一次写多张表的多行 ({title: [row]})：本地引擎每表一次 insert_many，写队列只落一次盘"""
+    batch = {title: rows for title, rows in batch.items() if rows}
+    if _store is not None:
+        for title, rows in batch.items():
+            _store.insert_many(title, rows)
+    if SHEETS_SYNC:
+        _enqueue_rows({title: [(uuid.uuid4().hex, row) for row in rows] for title, rows in batch.items()})
     else:
-        # Fallback / Error
-        raise FileNotFoundError("找不到 service_account.json 也没有配置 Secrets")
-
-    # Use the known SHEET_ID for reliability, or fallback to name
-    SHEET_ID = "109FTKIWh5LhypHuiXa9MemBxieGG4ck4M7eiem2t5pw" 
-    sheet = client.open_by_key(SHEET_ID).worksheet("Transactions")
-except Exception as e:
-    print(f"Connection Error: {e}")
-    # Fallback attempt if user insists on "finance_data" name matching
+        for title in batch:
+            _notify_write(title)
+
+def flush_writes():
+    """立即写出队列里的全部行 (退出前调用)，返回是否清空；没写出去的还在日志里，下次启动重放。
+    写线程正在刷的批次要等它刷完 (_flush_pending 先拿 _flush_lock，失败的会放回队列再一起刷)"""
+    return _flush_pending() and not _write_pending
+
+atexit.register(flush_writes)
+
+# --- Transactions Cache (本地账本缓存) ---
+# add_transaction 写穿到这里；查询时只增量拉取上次已知行数之后的新行，不再整表下载。
+TXN_SYNC_INTERVAL = 15   # 秒: 两次增量同步之间的最小间隔
+TXN_FULL_RESYNC = 600    # 秒: 定期整表校对一次 (防止有人在 Sheets 里手动删行/改行)
+TXN_SYNC_RETRIES = 3     # 读的期间缓存被改过，最多重读几次
+
+_txn_lock = threading.RLock()
+_txn_sync_lock = threading.Lock()  # 只管“谁去拉”，不挡读写缓存
+_txn_loaded = False  # 是否已经整表加载过
+_txn_rows = []     # 数据行 (第 2 行起)，每行是 TXN_COLUMNS 顺序的 tuple
+_txn_pending = {}  # entry id -> 已入写队列、还没确认落到 Sheets 的行 (已计入索引)
+_txn_inflight = 0  # 正在 append 的批次数; 期间不做同步，避免把同一行算两次
+_txn_last_sync = 0.0
+_txn_last_full = 0.0
+_txn_version = 0   # _txn_rows 每变一次 (同步换入 / 批次刷完) 加一，锁外读完后据此判断结果还能不能用
+
+# 账本只投影这几列；TXN_WRITE_ORDER 是 add_transaction 写入的列顺序
+TXN_COLUMNS = ("Date", "Item", "Amount", "Category")
+TXN_WRITE_ORDER = ("Date", "Item", "Amount", "Category", "Remarks")
+_DATE, _ITEM, _AMOUNT, _CATEGORY = range(len(TXN_COLUMNS))
+
+def sync_transactions(force=False):
+    """增量同步 Transactions: 首次 (或定期) 整表加载，之后只拉新增行。
+    网络读在锁外做 (读的时候 add_transaction 不用等)，读完在锁里换进缓存；
+    读的期间有批次刷进表 (缓存版本变了) 就作废重读，免得同一行算两次或漏掉"""
+    global _txn_loaded, _txn_last_sync, _txn_last_full
+    if not ensure_connected(): return
+    with _txn_sync_lock:  # 同一时间只有一个线程在拉，其余的等它拉完直接用缓存
+        for _ in range(TXN_SYNC_RETRIES):
+            with _txn_lock:
+                if _txn_inflight: return  # 写入进行中，先用本地视图
+                now = time.time()
+                full = force or not _txn_loaded or now - _txn_last_full > TXN_FULL_RESYNC
+                if not full and now - _txn_last_sync < TXN_SYNC_INTERVAL: return
+                cold = not force and not _txn_loaded
+                start = len(_txn_rows) + 2  # 表头占第 1 行
+                version = _txn_version
+            from_snapshot = False
+            if full:
+                # 冷启动先试快照 + 增量，不行再整表
+                rows = _snapshot_topup(TXN_SHEET, TXN_COLUMNS) if cold else None
+                from_snapshot = rows is not None
+                if not from_snapshot:
+                    get_header_map(TXN_SHEET, refresh=True)
+                    rows = read_columns(TXN_SHEET, TXN_COLUMNS)
+            else:
+                rows = read_columns(TXN_SHEET, TXN_COLUMNS, start_row=start)
+            with _txn_lock:
+                if _txn_inflight or _txn_version != version: continue
+                if full:
+                    _txn_rows[:] = rows
+                    _rebuild_index()
+                    _txn_loaded = True
+                    _txn_last_full = now
+                else:
+                    _txn_rows.extend(rows)
+                    for row in rows:
+                        _index_row(row)
+                _txn_last_sync = now
+                _bump_txn_version()
+                snapshot = list(_txn_rows) if full or rows else None
+            if snapshot is not None:
+                _save_snapshot(TXN_SHEET, TXN_COLUMNS, snapshot, force=full and not from_snapshot)
+            return
+
+def _bump_txn_version():
+    """调用方持有 _txn_lock"""
+    global _txn_version
+    _txn_version += 1
+
+def _txn_queued(entry_id, row):
+    """写穿缓存: 入队的行立即进入索引 (读己之写)，确认落表前挂在 _txn_pending"""
+    with _txn_lock:
+        by_name = dict(zip(TXN_WRITE_ORDER, row))
+        cached = tuple("" if by_name.get(c) is None else str(by_name[c]) for c in TXN_COLUMNS)
+        _txn_pending[entry_id] = cached
+        if _txn_loaded: _index_row(cached)  # 缓存还没建立的话，首次整表加载时会一起索引
+
+def _txn_begin_flush():
+    global _txn_inflight
+    with _txn_lock:
+        _txn_inflight += 1
+        _bump_txn_version()
+
+def _txn_end_flush(ids, response):
+    """批次写完: 新行正好接在缓存末尾就直接转正，否则 (别处也写过) 下次查询整表校对"""
+    global _txn_inflight, _txn_last_full
+    with _txn_lock:
+        _txn_inflight -= 1
+        if response is None: return  # 写失败，行还留在 _txn_pending 里等重试
+        flushed = [_txn_pending.pop(eid) for eid in ids if eid in _txn_pending]
+        updated = response.get("updates", {}).get("updatedRange", "")
+        m = re.search(r"![A-Z]+(\d+)", updated)
+        if _txn_loaded and m and int(m.group(1)) == len(_txn_rows) + 2:
+            _txn_rows.extend(flushed)
+            _bump_txn_version()
+        else:
+            _txn_last_full = 0.0
+
+def _txn_landed(ids):
+    """重放核对时发现这些行早就在表里了: 移出挂起区，下次查询整表校对"""
+    global _txn_last_full
+    with _txn_lock:
+        for eid in ids:
+            _txn_pending.pop(eid, None)
+        _txn_last_full = 0.0
+
+# --- Finance Index (聚合索引) ---
+# 每行只清洗一次金额，之后按日期 O(1) 查、按区间二分定位到账本切片。
+# 所有结构都在 _txn_lock 下维护，和缓存行保持同步。
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+_idx_by_date = {}      # date -> [total, items]
+
+# 按日期排序的明细账本 (只收 YYYY-MM-DD 格式的行)，区间查询二分定位后单次遍历
+_ledger = []           # (date, amount, category, item)
+_ledger_dates = []     # 与 _ledger 平行的日期 list，给 bisect 用
+
+_parse_amount = storage.parse_amount
+
+def _index_row(row, bulk=False):
+    """把一行账目加入索引 (bulk: 整表重建时先追加到账本末尾，最后统一排序)"""
+    val = _parse_amount(row[_AMOUNT])
+    if val is None: return
+    day = row[_DATE]
+    cat = row[_CATEGORY] or "Other"
+    entry = _idx_by_date.setdefault(day, [0.0, []])
+    entry[0] += val
+    entry[1].append(f"{row[_ITEM]} ({val})")
+    if _ISO_DATE.match(day):
+        if bulk:
+            _ledger.append((day, val, cat, row[_ITEM]))
+            return
+        # 绝大多数新账是最新日期，insert 落在末尾，均摊 O(1)
+        pos = bisect.bisect_right(_ledger_dates, day)
+        _ledger_dates.insert(pos, day)
+        _ledger.insert(pos, (day, val, cat, row[_ITEM]))
+
+def _rebuild_index():
+    """整表重建索引 (全量同步后调用)"""
+    _idx_by_date.clear()
+    del _ledger[:], _ledger_dates[:]
+    for row in _txn_rows + list(_txn_pending.values()):
+        _index_row(row, bulk=True)
+    # 稳定排序: 同一天的账保持原顺序 (和逐行 bisect_right 插入的结果一样)，O(n log n)
+    _ledger.sort(key=lambda e: e[0])
+    _ledger_dates[:] = [e[0] for e in _ledger]
+
+def query_finance_range(start_date, end_date, top_n=5):
+    """区间报表: 总额、分类明细、最大几笔，一次遍历完成"""
+    report = {"start": start_date, "end": end_date, "total": 0, "count": 0,
+              "by_category": {}, "top_items": []}
+    if _store is not None:
+        try:
+            report.update(_store.finance_range(start_date, end_date, top_n))
+        except Exception as e:
+            report["error"] = str(e)
+        return report
+    if not ensure_connected():
+        report["error"] = "No Sheet"
+        return report
     try:
-        if 'client' in locals():
-            sheet = client.open("finance_data").sheet1
-    except:
-        sheet = None
+        sync_transactions()
+        with _txn_lock:
+            lo = bisect.bisect_left(_ledger_dates, start_date)
+            hi = bisect.bisect_right(_ledger_dates, end_date)
+            entries = _ledger[lo:hi]
+        by_cat = {}
+        top = []  # 小顶堆，只保留最大的 top_n 笔
+        for day, val, cat, item in entries:
+            report["total"] += val
+            by_cat[cat] = by_cat.get(cat, 0.0) + val
+            if len(top) < top_n:
+                heapq.heappush(top, (val, day, item))
+            elif val > top[0][0]:
+                heapq.heapreplace(top, (val, day, item))
+        report["count"] = len(entries)
+        report["by_category"] = dict(sorted(by_cat.items(), key=lambda kv: -kv[1]))
+        report["top_items"] = [(item, val, day) for val, day, item in sorted(top, reverse=True)]
+    except Exception as e:
+        report["error"] = str(e)
+    return report
+
+def get_ledger():
+    """按日期排好的明细账 [(date, amount, category, item)] (只含 YYYY-MM-DD 日期的行)，给列式分析用"""
+    if _store is not None: return _store.ledger()
+    if not ensure_connected(): return []
+    sync_transactions()
+    with _txn_lock:
+        return list(_ledger)
 
 def add_transaction(date_str, item, amount, category, comment=""):
-    """存账"""
-    if not sheet: return "Error: No Sheet"
+    """存账 (先落本地日志再入写队列，立即返回；Sheets 断线也不丢)"""
     try:
-        sheet.append_row([date_str, item, amount, category, comment])
+        row = [date_str, item, amount, category, comment]
+        _write_row(TXN_SHEET, row)
         return "Saved"
     except Exception as e:
         return f"Error: {e}"
 
+def write_batch(transactions=(), memories=()):
+    """一次写入多条账和记忆 (一次日志落盘、一次入队)。
+    transactions: [(date, item, amount, category, comment)]；memories: [(category, observation, context)]"""
+    today = date.today().isoformat()
+    with _mem_lock:
+        _write_rows({
+            TXN_SHEET: [list(t) for t in transactions],
+            "Memory": [[today, cat, obs, ctx] for cat, obs, ctx in memories],
+        })
+        if _mem_last_load:
+            for m in memories:
+                memory_index.add(tuple(m))
+
 def get_expenses_by_date(target_date_str):
-    """🔥 核心升级: 可以查 任意一天 的账"""
-    if not sheet: return 0, ["Error: No Sheet"]
+    """🔥 核心升级: 可以查 任意一天 的账 (走本地索引，O(1))"""
+    if _store is None and not ensure_connected(): return 0, ["Error: No Sheet"]
     try:
-        all_records = sheet.get_all_records()
-        
-        total = 0
-        items = []
-        
-        for row in all_records:
-            # 比对每一行的日期，是否等于我们要查的那天
-            # row['Date'] might be int or string depending on format
-            if str(row.get('Date', '')) == target_date_str:
-                # 清洗数据，防止 RM 符号干扰
-                clean_amount = str(row.get('Amount', 0)).replace('RM', '').replace(',', '').strip()
-                if clean_amount:
-                    val = float(clean_amount)
-                    total += val
-                    items.append(f"{row.get('Item', '?')} ({val})")
-        
-        return total, items
+        if _store is not None: return _store.expenses_by_date(target_date_str)
+        sync_transactions()
+        with _txn_lock:
+            total, items = _idx_by_date.get(target_date_str, (0, []))
+            return total, list(items)
     except Exception as e:
         return 0, [f"查询出错: {e}"]
 
@@ -70,65 +940,182 @@ def get_today_total():
     return total
 
 # --- Memory Core (Long-Term Memory) ---
-def get_memories():
-    """读取所有记忆"""
-    if not sheet: return "No Memory Bank available."
+# 记忆先整表加载进本地 BM25 索引 (memory_index)，之后每次只取和当前输入相关的几条进 prompt。
+MEMORY_COLUMNS = ("Category", "Observation", "Context")
+MEMORY_TOP_K = 12           # 每次最多注入多少条记忆
+MEMORY_TOKEN_BUDGET = 800   # 注入记忆的 token 上限
+MEMORY_REFRESH = 300        # 秒: 定期整表重载 (捕捉在 Sheets 里手动改的记忆)
+MEMORY_LOAD_RETRIES = 3     # 读的期间有记忆落表，最多重读几次
+
+_mem_lock = threading.RLock()
+_mem_load_lock = threading.Lock()  # 只管“谁去拉”，不挡 save_memory
+_mem_last_load = 0.0
+_mem_rows = []   # Memory 表里已确认的行 (MEMORY_COLUMNS)
+_mem_pending = {}  # entry id -> 已入写队列、还没确认落表的记忆 (Category, Observation, Context)
+_mem_version = 0   # 每确认落表一批加一
+
+def _load_memories(force=False):
+    """整表加载 Memory 并重建检索索引 (带还没确认落表的)。
+    网络读在锁外做，save_memory / write_batch 不用等；读完在 _mem_lock 里换进去。
+    读的期间有记忆刷进表 (版本变了) 就重读，免得新记忆既不在读到的表里也不在挂起区"""
+    global _mem_last_load
+    with _mem_load_lock:  # 同一时间只有一个线程在拉，其余的等它拉完直接用
+        if not force and _mem_last_load and time.time() - _mem_last_load < MEMORY_REFRESH:
+            return
+        rows = None
+        for attempt in range(MEMORY_LOAD_RETRIES):
+            version = _mem_version
+            if _store is not None:
+                records = [tuple(row[1:4]) for row in _store.rows("Memory")]
+            else:
+                # 冷启动先试快照 + 增量，之后的定期重载都是整表
+                rows = None if force or _mem_last_load else _snapshot_topup("Memory", MEMORY_COLUMNS)
+                full = rows is None
+                if full: rows = read_columns("Memory", MEMORY_COLUMNS)
+            with _mem_lock:
+                if _mem_version != version and attempt + 1 < MEMORY_LOAD_RETRIES: continue
+                if rows is not None:
+                    _mem_rows[:] = rows
+                    landed = set(_mem_rows)
+                    records = _mem_rows + [r for r in _mem_pending.values() if r not in landed]
+                memory_index.rebuild(records)
+                _mem_last_load = time.time()
+            break
+        if rows is not None: _save_snapshot("Memory", MEMORY_COLUMNS, rows, force=full)
+
+def _mem_queued(entry_id, row):
+    """入队的记忆 (整行: Date, Category, Observation, Context) 确认落表前挂在 _mem_pending"""
+    with _mem_lock:
+        _mem_pending[entry_id] = tuple(row[1:4])
+
+def _mem_landed(ids):
+    """这些记忆已经确认在表里了: 移出挂起区，版本加一 (正在读表的加载会重读)"""
+    global _mem_version
+    with _mem_lock:
+        for eid in ids:
+            _mem_pending.pop(eid, None)
+        _mem_version += 1
+
+def get_memories(query=None, top_k=MEMORY_TOP_K, token_budget=MEMORY_TOKEN_BUDGET):
+    """读取和 query 相关的记忆 (没有 query 就取最新的)，格式化成 prompt 文本"""
+    if _store is None and not ensure_connected(): return "No Memory Bank available."
     try:
-        # 尝试连接 Memory Sheet
+        # 尝试连接 Memory Sheet (不存在会自动创建)
         try:
-            mem_sheet = client.open_by_key(SHEET_ID).worksheet("Memory")
+            _load_memories()
         except:
-            # 如果不存在，尝试创建（或返回空）
-            try:
-                mem_sheet = client.open_by_key(SHEET_ID).add_worksheet(title="Memory", rows=1000, cols=4)
-                mem_sheet.append_row(["Date", "Category", "Observation", "Context"])
-            except:
-                return "Memory System Offline (Please create 'Memory' tab in Sheets)"
-        
-        records = mem_sheet.get_all_records()
+            return "Memory System Offline (Please create 'Memory' tab in Sheets)"
+        records = memory_index.search(query, top_k=top_k, token_budget=token_budget)
         if not records:
             return "No memories yet."
             
         # 格式化记忆为文本
         memory_text = ""
-        for r in records:
-            memory_text += f"- [{r.get('Category')}] {r.get('Observation')} (Context: {r.get('Context')})\n"
+        for cat, obs, ctx in records:
+            memory_text += f"- [{cat}] {obs} (Context: {ctx})\n"
         return memory_text
 
     except Exception as e:
         return f"Memory Error: {e}"
 
 def save_memory(category, observation, context=""):
-    """写入新记忆"""
-    if not sheet: return "Error: No Sheet"
+    """写入新记忆 (先落本地日志再入写队列，同时加进检索索引)"""
     try:
-        mem_sheet = client.open_by_key(SHEET_ID).worksheet("Memory")
         today = date.today().isoformat()
-        mem_sheet.append_row([today, category, observation, context])
+        with _mem_lock:
+            _write_row("Memory", [today, category, observation, context])
+            if _mem_last_load:
+                memory_index.add((category, observation, context))
         return True
     except:
         return False
 
+def consolidate_memories(dry_run=False):
+    """整理记忆: 合并近似重复的观察 (memory_consolidation)，原始记录归档到 Memory_Archive。
+    返回 (整理前条数, 整理后条数)"""
+    if _store is None and not ensure_connected(): return 0, 0
+    with _mem_lock:  # 整理期间 save_memory 等着，保证不会有新行在改表时插进来
+        if SHEETS_SYNC: flush_writes()
+        if _store is not None:
+            rows = _store.rows("Memory")
+        else:
+            rows = read_columns("Memory", tuple(SHEET_HEADERS["Memory"]))
+        merged, archived = memory_consolidation.consolidate(rows)
+        if dry_run or not archived:
+            return len(rows), len(merged)
+        today = date.today().isoformat()
+        if _store is not None:
+            _store.insert_many("Memory_Archive", [list(r) + [today] for r in archived])
+            _store.replace_rows("Memory", merged)
+        if SHEETS_SYNC:
+            sheet_rows = len(rows) if _store is None else len(read_columns("Memory", ("Date",)))
+            _ws_call("Memory_Archive", lambda ws: ws.append_rows([list(r) + [today] for r in archived]), "sheet_write")
+            # 整理后的行没有 entry id: EntryId 列一起覆盖成空，免得旧 id 错位挂到别的行上
+            id_col = get_header_map("Memory").get(ENTRY_ID_HEADER)
+            width = max(len(SHEET_HEADERS["Memory"]), id_col or 0)
+            header = list(SHEET_HEADERS["Memory"]) + [""] * (width - len(SHEET_HEADERS["Memory"]))
+            if id_col: header[id_col - 1] = ENTRY_ID_HEADER
+            values = [header] + [list(r) + [""] * (width - len(r)) for r in merged]
+            def _rewrite(ws):
+                # 先覆盖再清尾巴: 中途挂了最多留几行重复，不会丢记忆
+                ws.update(range_name="A1", values=values)
+                ws.batch_clear([f"A{len(values) + 1}:{_col_letter(width)}{max(sheet_rows, len(merged)) + 1}"])
+            _ws_call("Memory", _rewrite, "sheet_write")
+    _load_memories(force=True)  # 放开 _mem_lock 再重载 (加载锁在 _mem_lock 外面拿)
+    _notify_write("Memory")
+    return len(rows), len(merged)
+
 # --- Assets Core (The CFO) ---
+# Assets 表很小，整表缓存在本地: 分类 -> (行号, 金额)。更新余额时先读那一行核对分类 (对不上就整表重载)，
+# 再一次写 A:C (不再 find + 两次 update_cell)，写完直接改缓存，get_assets 不用重读。
+ASSETS_REFRESH = 300   # 秒: 定期整表重载 (捕捉在 Sheets 里手动改的余额/行)
+
+_assets_lock = threading.RLock()      # 只护着缓存本身，拿着它不做网络调用
+_assets_sync_lock = threading.Lock()  # 整表加载和余额写入排队走网络 (新分类不会被追加两次)
+_assets_rows = {}       # category -> [行号, 金额原值]
+_assets_loaded_at = 0.0
+
+def _assets_fresh():
+    return _assets_loaded_at and time.time() - _assets_loaded_at < ASSETS_REFRESH
+
+def _load_assets(force=False):
+    """整表加载 Assets 建立 分类 -> 行号 索引 (没过期就用缓存)"""
+    if not force and _assets_fresh(): return
+    with _assets_sync_lock:
+        if not force and _assets_fresh(): return  # 等锁的时候别人已经加载过了
+        _reload_assets()
+
+def _reload_assets():
+    """整表重读换进缓存 (调用方持有 _assets_sync_lock)"""
+    global _assets_loaded_at
+    # 不存在会自动创建 (带 Cash / Investments 初始行)
+    records = read_columns("Assets", ("Category", "Amount"))
+    with _assets_lock:
+        _assets_rows.clear()
+        for i, (cat, raw_amt) in enumerate(records):
+            if cat: _assets_rows[cat] = [i + 2, raw_amt]  # 表头占第 1 行
+        _assets_loaded_at = time.time()
+
+def _invalidate_assets():
+    """缓存作废，下次整表重载"""
+    global _assets_loaded_at
+    _assets_loaded_at = 0.0
+
 def get_assets():
     """获取资产列表"""
-    if not sheet: return {"Cash": 0, "Investments": 0, "NetWorth": 0}
+    if _store is None and not ensure_connected(): return {"Cash": 0, "Investments": 0, "NetWorth": 0}
     try:
-        try:
-            asset_sheet = client.open_by_key(SHEET_ID).worksheet("Assets")
-        except:
-            asset_sheet = client.open_by_key(SHEET_ID).add_worksheet(title="Assets", rows=100, cols=3)
-            asset_sheet.append_row(["Category", "Amount", "LastUpdated"])
-            # Init default data
-            asset_sheet.append_row(["Cash", "0", date.today().isoformat()])
-            asset_sheet.append_row(["Investments", "0", date.today().isoformat()])
-
-        records = asset_sheet.get_all_records()
+        if _store is not None:
+            records = [row[:2] for row in _store.rows("Assets")]
+        else:
+            _load_assets()
+            with _assets_lock:
+                records = [(cat, raw_amt) for cat, (_, raw_amt) in _assets_rows.items()]
         assets = {"Cash": 0, "Investments": 0, "NetWorth": 0}
         
-        for r in records:
-            cat = r.get("Category")
-            amt = float(str(r.get("Amount")).replace(",",""))
+        for cat, raw_amt in records:
+            if not cat: continue
+            amt = float(str(raw_amt or 0).replace(",",""))
             if cat in assets:
                 assets[cat] = amt
             else:
@@ -139,43 +1126,105 @@ def get_assets():
     except Exception as e:
         return {"Error": str(e)}
 
+def _asset_row_matches(row, category):
+    """写之前核对: 第 row 行的 A 列还是不是这个分类"""
+    cells = _ws_call("Assets", lambda ws: ws.row_values(row), key=("row_values", row))
+    return bool(cells) and cells[0] == category
+
+def _write_asset(category, amount, today):
+    """把一个分类的余额写到 Sheets: 已有的行先核对分类再一次更新 A:C，新分类追加一行；写完更新本地缓存"""
+    _load_assets()
+    with _assets_sync_lock:
+        try:
+            with _assets_lock:
+                known = _assets_rows.get(category)
+            if known and not _asset_row_matches(known[0], category):
+                # 缓存的行号过期了 (表里插/删/排过序)：整表重载重新定位，免得写到别的分类上
+                _reload_assets()
+                with _assets_lock:
+                    known = _assets_rows.get(category)
+            if known:
+                row = known[0]
+                _ws_call("Assets", lambda ws: ws.update(range_name=f"A{row}:C{row}", values=[[category, amount, today]],
+                                                        raw=False), "sheet_write")
+            else:
+                response = _ws_call("Assets", lambda ws: ws.append_rows([[category, amount, today]]), "sheet_write")
+                m = re.search(r"![A-Z]+(\d+)", (response or {}).get("updates", {}).get("updatedRange", ""))
+                row = int(m.group(1)) if m else None
+            with _assets_lock:
+                if row is None:
+                    _invalidate_assets()  # 不知道落在哪一行，下次整表重载
+                else:
+                    _assets_rows[category] = [row, str(amount)]
+        except Exception:
+            _invalidate_assets()
+            raise
+
 def update_asset(category, amount):
-    """更新资产余额"""
-    if not sheet: return False
+    """更新资产余额 (Sheets 上只有一次写入，不重读)"""
+    if _store is None and not ensure_connected(): return False
     try:
-        ws = client.open_by_key(SHEET_ID).worksheet("Assets")
-        cell = ws.find(category)
-        if cell:
-            ws.update_cell(cell.row, 2, amount)
-            ws.update_cell(cell.row, 3, date.today().isoformat())
+        today = date.today().isoformat()
+        if _store is not None:
+            _store.set_asset(category, amount, today)
+            if SHEETS_SYNC:
+                # 本地已经是新值了，Sheets 由写线程按顺序同步 (和追加的行同一个队列，也进预写日志；入队时发写入通知)
+                _enqueue_row("Assets", [category, amount, today])
+                return True
         else:
-            ws.append_row([category, amount, date.today().isoformat()])
+            _write_asset(category, amount, today)
+        _notify_write("Assets")
         return True
     except Exception as e:
         return False
 
 # --- Tasks Core (The Strategist) ---
+TASK_COLUMNS = ("Task", "Status", "Priority")
+Task = namedtuple("Task", ["task", "status", "priority"])
+
 def get_tasks():
-    """获取待办事项"""
-    if not sheet: return []
+    """获取待办事项 (Task tuple 列表)"""
+    if _store is not None: return [Task(*r) for r in _store.pending_tasks()]
+    if not ensure_connected(): return []
     try:
-        try:
-            task_sheet = client.open_by_key(SHEET_ID).worksheet("Tasks")
-        except:
-            task_sheet = client.open_by_key(SHEET_ID).add_worksheet(title="Tasks", rows=1000, cols=4)
-            task_sheet.append_row(["Date", "Task", "Status", "Priority"])
-        
-        records = task_sheet.get_all_records()
-        pending = [r for r in records if r.get("Status") != "Done"]
+        # 不存在会自动创建
+        records = read_columns("Tasks", TASK_COLUMNS)
+        # 队列里是整行: Date, Task, Status, Priority
+        records += [tuple(row[1:4]) for row in _queued_rows("Tasks")]
+        pending = [Task(*r) for r in records if r[0] and r[1] != "Done"]
         return pending
     except:
         return []
 
 def add_task(task_name, priority="Normal"):
-    if not sheet: return False
     try:
-        ws = client.open_by_key(SHEET_ID).worksheet("Tasks")
-        ws.append_row([date.today().isoformat(), task_name, "Pending", priority])
+        _write_row("Tasks", [date.today().isoformat(), task_name, "Pending", priority])
         return True
     except:
         return False
+
+def _open_store():
+    """打开本地引擎；第一次用时从 Sheets 整表导入 (纯本地模式只写入初始资产行)"""
+    global _store
+    _store = storage.SQLiteStorage(SQLITE_PATH)
+    if _store.get_meta("seeded"): return
+    if ensure_connected():
+        for title in STORE_TABLES:
+            if not _store.count(title):
+                _store.insert_many(title, read_columns(title, tuple(SHEET_HEADERS[title])))
+        _store.set_meta("seeded", "sheets")
+    elif not SHEETS_SYNC:
+        _store.insert_many("Assets", _default_rows("Assets"))
+        _store.set_meta("seeded", "local")
+
+if STORAGE_BACKEND == "sqlite": _open_store()
+if SHEETS_SYNC: _replay_journal()
+
+def _save_snapshots():
+    """退出前把最新的已确认行存进快照"""
+    with _txn_lock:
+        if _txn_loaded: _save_snapshot(TXN_SHEET, TXN_COLUMNS, list(_txn_rows), force=True)
+    with _mem_lock:
+        if _mem_last_load: _save_snapshot("Memory", MEMORY_COLUMNS, list(_mem_rows), force=True)
+
+if STORAGE_BACKEND == "sheets": atexit.register(_save_snapshots)
@@ -0,0 +1,185 @@
+"""📈 Finance Analytics (列式账本分析)
+
+把明细账转成一份列式快照 (NumPy 数组: 日期序号、金额、分类编码、项目编码)，
+所有汇总都是向量化运算，几年的账也是毫秒级:
+
+    monthly_by_category()   每月每类花了多少
+    rolling_averages()      近 7 / 30 天日均
+    top_items()             花钱最多的项目/商家
+    burn_rate()             日均开销 vs Assets 里的 Cash，还能撑多少天
+    summary()               以上全部 (ASSETS 页和 query_analytics 命令用)
+
+快照在有新账时 (database 写入通知) 或超过 SNAPSHOT_TTL 秒后重建。
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+
+import database
+
+SNAPSHOT_TTL = 60     # 秒: 没有写入通知时也定期重建 (捕捉 Sheets 里手动改的账)
+ROLLING_WINDOWS = (7, 30)
+BURN_WINDOW = 30      # 天: 烧钱速度按最近多少天算
+
+# day: 日期序号 (1970-01-01 起的天数)；cat/item: 指向 categories/items 的编码
+Snapshot = namedtuple("Snapshot", ["day", "amount", "cat", "item", "categories", "items"])
+
+_lock = threading.Lock()
+_snapshot = None
+_built_at = 0.0
+_dirty = True
+
+def _on_write(title):
+    global _dirty
+    if title == database.TXN_SHEET:
+        _dirty = True
+
+database.on_write(_on_write)
+
+def _encode(values, codes):
+    """字符串列 -> 整数编码 (codes 记录 值 -> 编码，按首次出现的顺序)"""
+    return np.fromiter((codes.setdefault(str(v), len(codes)) for v in values), dtype=np.int64, count=len(values))
+
+def _valid_date(value):
+    try:
+        date.fromisoformat(str(value))
+        return True
+    except ValueError:
+        return False
+
+def build_snapshot(ledger):
+    """[(date, amount, category, item)] -> Snapshot"""
+    if not ledger:
+        empty = np.zeros(0, dtype=np.int64)
+        return Snapshot(empty, np.zeros(0), empty, empty, [], [])
+    dates, amounts, cats, items = zip(*ledger)
+    try:
+        days = np.asarray(dates, dtype="datetime64[D]")
+    except ValueError:
+        # 格式对但日子不存在 (Sheets 里手填的 2026-02-30)：丢掉这些行再建
+        return build_snapshot([row for row in ledger if _valid_date(row[0])])
+    cat_codes, item_codes = {}, {}
+    return Snapshot(
+        day=days.astype(np.int64),
+        amount=np.asarray(amounts, dtype=np.float64),
+        cat=_encode(cats, cat_codes),
+        item=_encode(items, item_codes),
+        categories=list(cat_codes),
+        items=list(item_codes),
+    )
+
+def get_snapshot(force=False):
+    """当前账本的列式快照 (有新账或过期才重建)"""
+    global _snapshot, _built_at, _dirty
+    with _lock:
+        if force or _dirty or _snapshot is None or time.time() - _built_at > SNAPSHOT_TTL:
+            _dirty = False
+            _snapshot = build_snapshot(database.get_ledger())
+            _built_at = time.time()
+        return _snapshot
+
+def _ordinal(d):
+    return int(np.datetime64(d, "D").astype(np.int64))
+
+def _mask(snap, start=None, end=None):
+    mask = np.ones(len(snap.day), dtype=bool)
+    if start is not None: mask &= snap.day >= _ordinal(start)
+    if end is not None: mask &= snap.day <= _ordinal(end)
+    return mask
+
+def monthly_by_category(snap=None, months=12, today=None):
+    """最近 months 个月每类支出: (['YYYY-MM', ...], {category: [每月金额]})"""
+    snap = snap if snap is not None else get_snapshot()
+    today = today or date.today()
+    last = np.datetime64(today, "M").astype(np.int64)
+    first = last - months + 1
+    month = snap.day.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    keep = (month >= first) & (month <= last)
+    grid = np.zeros((months, len(snap.categories)))
+    np.add.at(grid, (month[keep] - first, snap.cat[keep]), snap.amount[keep])
+    labels = [str(np.datetime64(int(m), "M")) for m in range(first, last + 1)]
+    used = np.flatnonzero(grid.sum(axis=0))
+    return labels, {snap.categories[c]: grid[:, c].round(2).tolist() for c in used}
+
+def daily_totals(snap=None, days=90, today=None):
+    """最近 days 天每天的总支出 (NumPy 数组，最后一个是今天)"""
+    snap = snap if snap is not None else get_snapshot()
+    end = _ordinal(today or date.today())
+    start = end - days + 1
+    keep = (snap.day >= start) & (snap.day <= end)
+    return np.bincount(snap.day[keep] - start, weights=snap.amount[keep], minlength=days)
+
+def rolling_averages(snap=None, windows=ROLLING_WINDOWS, today=None):
+    """截至今天的 N 天日均支出: {7: x, 30: y}"""
+    daily = daily_totals(snap, max(windows), today)
+    return {w: float(daily[-w:].mean()) for w in windows}
+
+def rolling_series(snap=None, window=7, days=90, today=None):
+    """最近 days 天每天的 window 天滚动日均 (前缀和算，O(n))"""
+    daily = daily_totals(snap, days + window - 1, today)
+    c = np.concatenate(([0.0], np.cumsum(daily)))
+    return (c[window:] - c[:-window]) / window
+
+def top_items(snap=None, n=5, start=None, end=None):
+    """区间内花钱最多的项目/商家: [(item, total, 笔数)]"""
+    snap = snap if snap is not None else get_snapshot()
+    keep = _mask(snap, start, end)
+    totals = np.bincount(snap.item[keep], weights=snap.amount[keep], minlength=len(snap.items))
+    counts = np.bincount(snap.item[keep], minlength=len(snap.items))
+    order = np.argsort(-totals, kind="stable")[:n]
+    return [(snap.items[i], float(totals[i]), int(counts[i])) for i in order if totals[i] > 0]
+
+def burn_rate(snap=None, cash=None, window=BURN_WINDOW, today=None):
+    """烧钱速度: {daily, monthly, cash, runway_days}；runway_days 为 None 表示最近没花钱"""
+    daily = float(daily_totals(snap, window, today).mean())
+    if cash is None:
+        cash = float(database.get_assets().get("Cash", 0) or 0)
+    return {
+        "daily": daily,
+        "monthly": daily * 30,
+        "cash": cash,
+        "runway_days": cash / daily if daily > 0 else None,
+    }
+
+def summary(today=None, cash=None):
+    """ASSETS 页和 query_analytics 命令用的整套分析"""
+    today = today or date.today()
+    snap = get_snapshot()
+    months, by_category = monthly_by_category(snap, today=today)
+    return {
+        "rows": len(snap.day),
+        "months": months,
+        "monthly_by_category": by_category,
+        "rolling": rolling_averages(snap, today=today),
+        "top_items": top_items(snap, start=today - timedelta(days=89), end=today),
+        "burn": burn_rate(snap, cash=cash, today=today),
+    }
+
+def dashboard_summary():
+    """给仪表盘用: 出错时返回 {"error": ...}，不让整页挂掉"""
+    try:
+        return summary()
+    except Exception as e:
+        return {"error": str(e)}
+
+def format_summary(s):
+    """summary() -> 聊天回复用的 Markdown"""
+    burn = s["burn"]
+    runway = f"{burn['runway_days']:.0f} 天" if burn["runway_days"] is not None else "∞"
+    lines = [
+        "📈 **财务分析**",
+        "",
+        f"**日均支出:** 近 7 天 RM{s['rolling'][7]:.2f} | 近 30 天 RM{s['rolling'][30]:.2f}",
+        f"**烧钱速度:** RM{burn['monthly']:.2f}/月 | Cash RM{burn['cash']:,.2f} 还能撑 {runway}",
+    ]
+    if s["months"] and s["monthly_by_category"]:
+        month = s["months"][-1]
+        cats = sorted(((c, v[-1]) for c, v in s["monthly_by_category"].items() if v[-1]), key=lambda kv: -kv[1])
+        if cats:
+            lines += ["", f"**{month} 分类:**"] + [f"- {c}: RM{v:.2f}" for c, v in cats]
+    if s["top_items"]:
+        lines += ["", "**近 90 天花钱最多:**"] + [f"- {i} (RM{v:.2f}, {n} 笔)" for i, v, n in s["top_items"]]
+    return "\n".join(lines)
@@ -3,7 +3,7 @@ import database
 print("Checking Sheet Headers...")
 try:
     # Access the sheet object from database module
-    if database.sheet:
+    if database.ensure_connected():
         headers = database.sheet.row_values(1)
         print(f"Current Headers: {headers}")
         
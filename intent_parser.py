@@ -0,0 +1,213 @@
+"""⚡ 本地意图解析: 正则 + 相对日期把简单的记账/查账直接转成命令 JSON，没把握就返回 None。"""
+import re
+import threading
+from datetime import date, timedelta
+
+MIN_CONFIDENCE = 0.8
+
+CATEGORY_KEYWORDS = {
+    "Food": ["food", "lunch", "dinner", "breakfast", "brunch", "supper", "meal", "coffee", "kopi",
+             "tea", "nasi", "mamak", "snack", "drink", "吃", "饭", "餐", "咖啡", "奶茶", "宵夜", "外卖"],
+    "Transport": ["transport", "grab", "taxi", "uber", "petrol", "fuel", "parking", "toll", "lrt", "mrt",
+                  "bus", "train", "打车", "油", "停车", "地铁", "车费", "过路费"],
+    "Shopping": ["shopping", "shopee", "lazada", "clothes", "shoes", "购物", "衣服", "鞋", "买"],
+}
+
+# 本地生成的吐槽 (LLM 路径是模型现编的)
+COMMENTS = {
+    "Food": ["又吃？钱包在哭。", "吃饱了才有力气搞钱。", "这顿记下了，别忘了健身。"],
+    "Transport": ["跑来跑去，油钱也是钱。", "路费记好了，下次走路？", "出门就是烧钱。"],
+    "Shopping": ["买买买，库存又多一件。", "真的需要吗？算了已经买了。", "剁手预备。"],
+    "Other": ["记下了，钱花哪都得有个数。", "收到，账本不会忘。"],
+}
+
+_WEEKDAYS_EN = {"monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+                "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+_WEEKDAYS_ZH = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+_ZH_NUM = {"一": 1, "两": 2, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+
+_QUERY_RE = re.compile(r"how much|what did|how many|total|spent\?|多少|什么|啥|哪些|总共|[?？]", re.I)
+# 查账必须带花钱的词: "How much sleep did I get yesterday" / "今天天气多少度" 不是查账
+_MONEY_RE = re.compile(r"\b(spen[dt]|spending|expenses?|paid|pay|bought|buy|cost)\b|花|消费|支出|开销|买|付|账", re.I)
+_SPEND_RE = re.compile(r"\b(spent|spend|paid|pay|bought|buy)\b|花了|花|买了|付了", re.I)
+# 记账只认“已经花了”的说法；提醒、打算、问句、限额这类都交给模型
+_SPENT_RE = re.compile(r"\b(spent|paid|bought|purchased)\b|花了|买了|付了|刷了", re.I)
+_INTENT_RE = re.compile(
+    r"\b(remind|should|shall|would|could|want|wanna|going to|gonna|will|plan|planning|need to|"
+    r"don'?t|do not|never|budget|limit|more than|if|can i|let me)\b"
+    r"|[?？]|提醒|应该|想|要|打算|准备|计划|别|不要|不能|如果|吗|预算", re.I)
+_CURRENCY = r"rm|myr|ringgit|\$"
+_AMOUNT_RE = re.compile(
+    r"(?:rm|\$|myr)\s*(\d[\d,]*(?:\.\d+)?)"            # RM50 / $12.5
+    r"|(\d[\d,]*(?:\.\d+)?)\s*(?:rm|myr|ringgit|块|元|蚊)"  # 50块 / 50 ringgit
+    r"|(\d[\d,]*(?:\.\d+)?)", re.I)                    # 裸数字
+_ISO_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def _num(token):
+    return int(token) if token.isdigit() else _ZH_NUM.get(token, 0)
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def resolve_date(text, today):
+    """相对日期 -> date；找不到返回 None"""
+    low = text.lower()
+    if m := _ISO_RE.search(low):
+        try:
+            return date.fromisoformat(m.group(1))
+        except ValueError:
+            return None  # 2026-02-30 这种打错的日期: 交给模型
+    if "day before yesterday" in low or "前天" in text:
+        return today - timedelta(days=2)
+    if "yesterday" in low or "昨天" in text or "昨晚" in text:
+        return today - timedelta(days=1)
+    if "today" in low or "tonight" in low or "今天" in text or "今晚" in text:
+        return today
+    if m := re.search(r"(\d+|[一两二三四五六七八九十])\s*(?:days? ago|天前)", low):
+        return today - timedelta(days=_num(m.group(1)))
+    if m := re.search(r"(上|这|本)?(?:周|星期|礼拜)([一二三四五六日天])", text):
+        start = _week_start(today) - timedelta(days=7 if m.group(1) == "上" else 0)
+        day = start + timedelta(days=_WEEKDAYS_ZH[m.group(2)])
+        return day if m.group(1) or day <= today else day - timedelta(days=7)
+    if m := re.search(r"\b(last|this|on)?\s*(" + "|".join(_WEEKDAYS_EN) + r")\b", low):
+        target = _WEEKDAYS_EN[m.group(2)]
+        if m.group(1) == "last":
+            back = (today.weekday() - target) % 7 or 7  # 严格早于今天的最近一个
+            return today - timedelta(days=back)
+        day = _week_start(today) + timedelta(days=target)
+        return day if day <= today else day - timedelta(days=7)
+    return None
+
+def resolve_range(text, today):
+    """区间说法 -> (start, end)；找不到返回 None"""
+    low = text.lower()
+    if m := re.search(r"(?:last|past)\s+(\d+)\s+days|(?:过去|最近|近)\s*(\d+|[一两二三四五六七八九十])\s*天", low):
+        n = _num(m.group(1) or m.group(2))
+        return today - timedelta(days=max(n, 1) - 1), today
+    if "last week" in low or re.search(r"上(?:周|个?星期|个?礼拜)(?![一二三四五六日天])", text):
+        start = _week_start(today) - timedelta(days=7)
+        return start, start + timedelta(days=6)
+    if "this week" in low or re.search(r"(?:这|本)(?:周|个?星期|个?礼拜)(?![一二三四五六日天])", text):
+        return _week_start(today), today
+    if "last month" in low or re.search(r"上个?月", text):
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end
+    if "this month" in low or re.search(r"(?:这个|本)月", text):
+        return today.replace(day=1), today
+    if "this year" in low or "今年" in text:
+        return today.replace(month=1, day=1), today
+    return None
+
+def _category(text):
+    low = text.lower()
+    if m := re.search(r"\bon\s+(food|transport|shopping|other)\b", low):
+        return m.group(1).capitalize()
+    for cat, words in CATEGORY_KEYWORDS.items():
+        if any(w in low for w in words):
+            return cat
+    return "Other"
+
+def _item(text, category):
+    """尽量从原话里抠出消费项目: (item, 来源)。来源: phrase (on/for 后面的词)、leftover (去掉金额/动词/日期剩下的字)、
+    category (什么都没剩，用分类名)"""
+    if m := re.search(rf"\b(?:on|for)\s+(?!(?:{_CURRENCY})\s*\d)([a-z][\w\s'-]*)", text, re.I):
+        stop = (r"\b(?:on|at|last|this|today|yesterday|just now|" + "|".join(_WEEKDAYS_EN) + r")\b"
+                rf"|(?:{_CURRENCY})(?=\s*\d)|\d")
+        item = re.split(stop, m.group(1), flags=re.I)[0].strip()
+        if item: return item.title(), "phrase"
+    rest = _AMOUNT_RE.sub(" ", text)
+    rest = _SPEND_RE.sub(" ", rest)
+    rest = re.sub(r"今天|昨天|前天|今晚|昨晚|刚刚|在|了(?=\s|$|[,，。.!！])|\b(?:on|for|today|yesterday)\b|[,，。.!！]",
+                  " ", rest, flags=re.I)
+    rest = " ".join(rest.split())
+    return (rest[:40], "leftover") if rest else (category, "category")
+
+def _record(text, today):
+    if _INTENT_RE.search(text) or not _SPENT_RE.search(text): return None, 0.0
+    amounts = [next(g for g in m.groups() if g) for m in _AMOUNT_RE.finditer(text)]
+    amounts = [a for a in amounts if not _ISO_RE.search(text) or a not in _ISO_RE.search(text).group(1)]
+    if len(amounts) != 1: return None, 0.0
+    if _ISO_RE.search(text) and resolve_date(text, today) is None: return None, 0.0  # 日期打错了
+    amount = float(amounts[0].replace(",", ""))
+    if amount <= 0: return None, 0.0
+    explicit_currency = bool(re.search(r"rm|\$|myr|ringgit|块|元|蚊", text, re.I))
+    category = _category(text)
+    item, source = _item(text, category)
+    # 项目是剩下的字拼出来的 (或者干脆没有)，把握就低一些
+    penalty = {"phrase": 0.0, "leftover": 0.2, "category": 0.3}[source]
+    confidence = round(0.7 + 0.2 * explicit_currency + 0.1 * (category != "Other") - penalty, 2)
+    day = resolve_date(text, today) or today
+    comments = COMMENTS.get(category, COMMENTS["Other"])
+    data = {
+        "type": "record",
+        "date": day.isoformat(),
+        "item": item,
+        "amount": round(amount, 2),
+        "category": category,
+        "comment": comments[sum(map(ord, item)) % len(comments)],
+    }
+    return data, confidence
+
+def _query(text, today):
+    if not _MONEY_RE.search(text): return None, 0.0
+    if _ISO_RE.search(text) and resolve_date(text, today) is None: return None, 0.0  # 日期打错了
+    if rng := resolve_range(text, today):
+        start, end = rng
+        return {"type": "query_finance_range", "start_date": start.isoformat(), "end_date": end.isoformat()}, 0.9
+    if day := resolve_date(text, today):
+        return {"type": "query_finance", "target_date": day.isoformat()}, 0.9
+    if re.search(r"how much|多少", text, re.I):
+        return {"type": "query_finance", "target_date": today.isoformat()}, 0.8
+    return None, 0.0
+
+def parse(text, today=None):
+    """本地解析记账/查账命令。返回和 LLM 同格式的命令 dict；把握不够返回 None (交给模型)"""
+    today = today or date.today()
+    text = str(text).strip()
+    if not text or len(text) > 120:
+        data, confidence = None, 0.0  # 长句多半是聊天
+    elif _QUERY_RE.search(text):
+        data, confidence = _query(text, today)
+    else:
+        data, confidence = _record(text, today)
+    hit = data is not None and confidence >= MIN_CONFIDENCE
+    with _lock:
+        _stats["hits" if hit else "misses"] += 1
+    return data if hit else None
+
+def stats():
+    """命中统计: 省掉了多少次 LLM 调用"""
+    with _lock:
+        total = _stats["hits"] + _stats["misses"]
+        return dict(_stats, total=total, hit_rate=_stats["hits"] / total if total else 0.0)
+
+# 回归用例: python intent_parser.py 跑一遍 (today 固定为 2026-10-18，周日)
+_CASES = [
+    ("今天花了多少", {"type": "query_finance", "target_date": "2026-10-18"}),
+    ("how much did I spend last week", {"type": "query_finance_range", "start_date": "2026-10-05", "end_date": "2026-10-11"}),
+    ("Spent RM50 on lunch", {"type": "record", "date": "2026-10-18", "item": "Lunch", "amount": 50.0, "category": "Food"}),
+    ("买了 iPhone 5000块", {"type": "record", "item": "iPhone", "amount": 5000.0}),
+    ("How much is bitcoin today?", None),
+    ("今天天气多少度？", None),
+    ("How much sleep did I get yesterday?", None),
+    ("昨天睡了多少小时", None),
+    ("how much protein did I eat today", None),
+    ("这个月我学了什么？", None),
+    ("What is the total of my investments this year?", None),
+    ("how much did I spend on 2026-02-30?", None),
+    ("spent RM5 on coffee 2026-13-01", None),
+    ("Remind me to pay RM300 rent on Friday", None),
+    ("I want to buy shoes for RM250", None),
+]
+
+if __name__ == "__main__":
+    failed = 0
+    for text, expected in _CASES:
+        got = parse(text, date(2026, 10, 18))
+        ok = got == expected if expected is None or got is None else all(got.get(k) == v for k, v in expected.items())
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {text!r} -> {got}")
+    raise SystemExit(1 if failed else 0)
@@ -1,9 +1,10 @@
 import os
-import json
 import datetime
 import google.generativeai as genai
 from dotenv import load_dotenv
+import commands
 import database
+import intent_parser
 
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
@@ -14,15 +15,12 @@ print("⏳ 时空穿梭版助手 (V4.0) 已就绪")
 print("试试问: '昨天花了多少?' 或 '上周五吃了什么?'")
 print("="*50 + "\n")
 
-def extract_json(text):
-    try:
-        start = text.find('{')
-        end = text.rfind('}') + 1
-        if start != -1 and end != -1:
-            return json.loads(text[start:end])
-    except:
-        pass
-    return None
+def extract_commands(text, today):
+    """模型回复 -> 校验过的命令列表 (校验不过的打印原因，不再静默丢掉)"""
+    _, cmds, errors = commands.parse(text, today)
+    for e in errors:
+        print(f"⚠️ 有一条指令没执行: {e}")
+    return cmds
 
 while True:
     try:
@@ -33,72 +31,106 @@ while True:
     if not user_input.strip(): continue
 
     try:
-        print("🧠 正在计算时空坐标...")
         today = datetime.date.today().isoformat()
+
+        # ⚡ 简单的记账/查账本地直接解析，省一次模型调用
+        data = intent_parser.parse(user_input)
+        if data:
+            print("⚡ 本地解析")
+            cmds = [data]
+        else:
+            print("🧠 正在计算时空坐标...")
         
-        # --- 核心升级：让 AI 负责推算日期 ---
-        prompt = f"""
-        Current Date: {today}
-        User Input: "{user_input}"
+            # --- 核心升级：让 AI 负责推算日期 ---
+            prompt = f"""
+            Current Date: {today}
+            User Input: "{user_input}"
         
-        Task:
-        1. If user wants to RECORD (spend money), output type="record".
-        2. If user wants to QUERY (ask history), output type="query".
-           CRITICAL: Convert words like "yesterday", "last friday", "今天" into actual date strings (YYYY-MM-DD).
+            Task:
+            1. If user wants to RECORD (spend money), output type="record".
+            2. If user wants to QUERY (ask history), output type="query_finance".
+               CRITICAL: Convert words like "yesterday", "last friday", "今天" into actual date strings (YYYY-MM-DD).
+            3. If user asks about a PERIOD ("last week", "this month by category", "这个月"), output type="query_finance_range".
+            Several requests in one input -> one command each, in order.
         
-        Output JSON ONLY:
+            Output JSON ONLY: {{"reply": "", "commands": [ ... ]}}, each command one of:
         
-        [CASE 1: RECORD]
-        {{
-            "type": "record",
-            "date": "{today}",
-            "item": "string", 
-            "amount": number,
-            "category": "Food/Transport/Shopping/Other",
-            "comment": "Sarcastic remark in Chinese"
-        }}
+            [CASE 1: RECORD]
+            {{
+                "type": "record",
+                "date": "{today}",
+                "item": "string", 
+                "amount": number,
+                "category": "Food/Transport/Shopping/Other",
+                "comment": "Sarcastic remark in Chinese"
+            }}
+
+            [CASE 2: QUERY]
+            {{
+                "type": "query_finance",
+                "target_date": "YYYY-MM-DD" 
+            }}
 
-        [CASE 2: QUERY]
-        {{
-            "type": "query",
-            "target_date": "YYYY-MM-DD" 
-        }}
-        """
+            [CASE 3: RANGE QUERY]
+            {{
+                "type": "query_finance_range",
+                "start_date": "YYYY-MM-DD",
+                "end_date": "YYYY-MM-DD"
+            }}
+            """
         
-        response = model.generate_content(prompt)
-        data = extract_json(response.text)
+            response = model.generate_content(prompt, generation_config=commands.generation_config())
+            cmds = extract_commands(response.text, today)
 
-        if not data:
+        if not cmds:
             print("⚠️ 信号不好，再说一遍？")
             continue
 
-        # --- 场景 1: 记账 ---
-        if data.get('type') == 'record':
-            # Basic validation
-            if data.get('amount', 0) > 0:
-                database.add_transaction(
-                    data.get('date'), data.get('item'), data.get('amount'), 
-                    data.get('category'), data.get('comment')
-                )
-                print(f"✅ 记账成功: {data.get('item')} (RM{data.get('amount')})")
-                print(f"🦜 吐槽: {data.get('comment')}")
+        # --- 场景 1: 记账 (一条输入里的几笔一次写入) ---
+        records = [c for c in cmds if c.get('type') == 'record']
+        if records:
+            database.write_batch([(c['date'], c['item'], c['amount'], c['category'], c.get('comment', '')) for c in records])
+            for c in records:
+                print(f"✅ 记账成功: {c['item']} (RM{c['amount']})")
+                if c.get('comment'): print(f"🦜 吐槽: {c['comment']}")
 
-        # --- 场景 2: 查旧账 (Time Travel) ---
-        elif data.get('type') == 'query':
-            target_date = data.get('target_date')
-            print(f"🔎 正在穿越回 {target_date} 查账...")
+        for data in cmds:
+            # --- 场景 2: 查旧账 (Time Travel) ---
+            if data.get('type') == 'query_finance':
+                target_date = data.get('target_date')
+                print(f"🔎 正在穿越回 {target_date} 查账...")
             
-            total, items = database.get_expenses_by_date(target_date)
+                total, items = database.get_expenses_by_date(target_date)
             
-            print(f"\n📅 日期: {target_date}")
-            print(f"💰 当天总支出: RM {total:.2f}")
-            if items:
-                print("🧾 消费明细:")
-                for i in items:
-                    print(f"   - {i}")
-            else:
-                print("   (那天好像没花钱，或者是没记账？)")
-            print("-" * 30 + "\n")
+                print(f"\n📅 日期: {target_date}")
+                print(f"💰 当天总支出: RM {total:.2f}")
+                if items:
+                    print("🧾 消费明细:")
+                    for i in items:
+                        print(f"   - {i}")
+                else:
+                    print("   (那天好像没花钱，或者是没记账？)")
+                print("-" * 30 + "\n")
+
+            # --- 场景 3: 查区间 (周报 / 月报) ---
+            elif data.get('type') == 'query_finance_range':
+                start, end = data.get('start_date'), data.get('end_date')
+                print(f"🔎 正在汇总 {start} → {end} ...")
+
+                report = database.query_finance_range(start, end)
+
+                print(f"\n📅 区间: {start} → {end}")
+                print(f"💰 总支出: RM {report['total']:.2f} ({report['count']} 笔)")
+                if report['by_category']:
+                    print("📊 分类:")
+                    for cat, val in report['by_category'].items():
+                        print(f"   - {cat}: RM {val:.2f}")
+                    print("🧾 最大几笔:")
+                    for item, val, day in report['top_items']:
+                        print(f"   - {item} (RM {val:.2f}, {day})")
+                else:
+                    print("   (这段时间没有记录)")
+                print("-" * 30 + "\n")
 
     except Exception as e:
         print(f"❌ 系统短路: {e}")
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""🧹 记忆整理: MinHash + LSH 找出近似重复的记忆，合并成带计数的一条。"""
+import argparse
+import re
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+SHINGLE_SIZE = 3     # 字符 3-gram (中英文通用)
+NUM_PERM = 64        # MinHash 签名长度
+BANDS = 16           # LSH: 16 段 × 4 行
+SIMILARITY = 0.6     # 估计 Jaccard 不低于这个值才算同一条
+
+_PRIME = (1 << 31) - 1   # a * h 不会溢出 uint64
+_rng = np.random.default_rng(20240101)  # 固定种子: 每次跑签名一致
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+_COUNT_RE = re.compile(r"\s*\(×(\d+)\)\s*$")
+
+def split_count(observation):
+    """'User eats snacks (×3)' -> ('User eats snacks', 3)；没合并过的计数为 1"""
+    m = _COUNT_RE.search(observation)
+    if not m: return observation.strip(), 1
+    return observation[:m.start()].strip(), int(m.group(1))
+
+def _normalize(text):
+    text = re.sub(r"[^\w\s]", " ", split_count(str(text))[0].lower())
+    return " ".join(text.split())
+
+def signature(text):
+    """文本的 MinHash 签名 (NUM_PERM 个 uint64)"""
+    norm = _normalize(text)
+    shingles = {norm[i:i + SHINGLE_SIZE] for i in range(max(len(norm) - SHINGLE_SIZE + 1, 1))}
+    h = np.array([zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles], dtype=np.uint64)
+    return ((_A[:, None] * h[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+def cluster(observations):
+    """把近似重复的观察分组，返回下标分组 (每组按原顺序)"""
+    n = len(observations)
+    if n == 0: return []
+    sigs = np.stack([signature(o) for o in observations])
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    rows = NUM_PERM // BANDS
+    for band in range(BANDS):
+        buckets = {}
+        for i, key in enumerate(sigs[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(key.tobytes(), []).append(i)
+        for members in buckets.values():
+            for j in members[1:]:
+                i = members[0]
+                if find(i) != find(j) and np.mean(sigs[i] == sigs[j]) >= SIMILARITY:
+                    parent[find(j)] = find(i)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+def _merge(records):
+    """一组近似重复的记录 -> 一条带计数的记录 (Date, Category, Observation, Context)"""
+    texts, total = [], 0
+    for _, _, obs, _ in records:
+        text, count = split_count(str(obs))
+        texts.append(text)
+        total += count
+    # 代表句: 出现最多的写法里最新的一条
+    common = Counter(_normalize(t) for t in texts).most_common(1)[0][0]
+    text = next(t for t in reversed(texts) if _normalize(t) == common)
+    category = Counter(r[1] for r in records).most_common(1)[0][0]
+    dates = sorted(str(r[0]) for r in records if r[0])
+    span = f"{dates[0]} → {dates[-1]}" if dates else "?"
+    return (dates[-1] if dates else "", category, f"{text} (×{total})", f"Consolidated ({span})")
+
+def consolidate(records):
+    """records: [(Date, Category, Observation, Context)]
+    返回 (整理后的记录, 被合并掉的原始记录)。合并后的记录放在该组最新一条的位置，保持时间顺序。"""
+    groups = cluster([r[2] for r in records])
+    merged, archived = [], []
+    for members in sorted(groups, key=lambda g: g[-1]):
+        if len(members) == 1:
+            merged.append(tuple(records[members[0]]))
+        else:
+            originals = [tuple(records[i]) for i in members]
+            merged.append(_merge(originals))
+            archived.extend(originals)
+    return merged, archived
+
+def main():
+    parser = argparse.ArgumentParser(description="合并 Memory 表里近似重复的记忆")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不改表")
+    parser.add_argument("--every", type=float, default=0, help="每隔多少小时跑一次 (0 = 只跑一次)")
+    args = parser.parse_args()
+
+    import database
+    while True:
+        before, after = database.consolidate_memories(dry_run=args.dry_run)
+        print(f"🧹 Memory: {before} -> {after} 条")
+        if not args.every: break
+        time.sleep(args.every * 3600)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""🧠 Memory Retrieval (记忆检索)
+
+本地 BM25 索引: 每次只把和当前输入最相关的几条记忆塞进 prompt，
+而不是整张 Memory 表。postings 以 COO 形式存 (term id, doc id, tf)，
+打分时用 NumPy 一次性向量化计算。新记忆 add() 增量追加，不用重建。
+"""
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+# BM25 参数
+K1 = 1.5
+B = 0.75
+
+# 英文高频虚词 (几乎每条记忆都是 "User ..."，留着只会稀释分数)
+STOPWORDS = {"a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for",
+             "is", "are", "was", "be", "with", "user", "users", "s"}
+
+_WORD_RE = re.compile(r"[a-z0-9]+|[一-鿿]+")
+
+_lock = threading.Lock()
+_docs = []        # 原始记录 (category, observation, context)，下标就是 doc id
+_doc_len = []     # 每条记忆的词数
+_vocab = {}       # term -> term id
+_post_term = []   # postings: term id
+_post_doc = []    # postings: doc id
+_post_tf = []     # postings: 词频
+_arrays = None    # postings 的 NumPy 版本，有新增时置 None 下次查询再转
+
+def tokenize(text):
+    """英文按词切；中文没有空格，用单字 + 相邻二字组合"""
+    tokens = []
+    for chunk in _WORD_RE.findall(str(text).lower()):
+        if "一" <= chunk[0] <= "鿿":
+            tokens.extend(chunk)
+            tokens.extend(chunk[i:i + 2] for i in range(len(chunk) - 1))
+        elif chunk not in STOPWORDS:
+            tokens.append(chunk)
+    return tokens
+
+def estimate_tokens(text):
+    """粗估 LLM token 数: 中文约一字一 token，其他约 4 字符一 token"""
+    text = str(text)
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def _add_locked(record):
+    global _arrays
+    doc_id = len(_docs)
+    tokens = tokenize(" ".join(str(x) for x in record))
+    for term, tf in Counter(tokens).items():
+        _post_term.append(_vocab.setdefault(term, len(_vocab)))
+        _post_doc.append(doc_id)
+        _post_tf.append(tf)
+    _docs.append(tuple(record))
+    _doc_len.append(len(tokens))
+    _arrays = None
+
+def rebuild(records):
+    """用整表记录重建索引"""
+    global _arrays
+    with _lock:
+        for lst in (_docs, _doc_len, _post_term, _post_doc, _post_tf):
+            del lst[:]
+        _vocab.clear()
+        _arrays = None
+        for record in records:
+            _add_locked(record)
+
+def add(record):
+    """增量加入一条新记忆"""
+    with _lock:
+        _add_locked(record)
+
+def size():
+    return len(_docs)
+
+def _get_arrays():
+    global _arrays
+    if _arrays is None:
+        terms = np.asarray(_post_term, dtype=np.int64)
+        _arrays = (
+            terms,
+            np.asarray(_post_doc, dtype=np.int64),
+            np.asarray(_post_tf, dtype=np.float64),
+            np.asarray(_doc_len, dtype=np.float64),
+            np.bincount(terms, minlength=len(_vocab)).astype(np.float64),  # document frequency
+        )
+    return _arrays
+
+def _rank(query):
+    """BM25 打分，返回按相关度排好的 doc id (只含分数 > 0 的)"""
+    q_ids = [_vocab[t] for t in set(tokenize(query)) if t in _vocab]
+    if not q_ids: return []
+    terms, docs, tfs, doc_len, df = _get_arrays()
+    mask = np.isin(terms, q_ids)
+    t, d, tf = terms[mask], docs[mask], tfs[mask]
+    n = len(_docs)
+    idf = np.log1p((n - df[t] + 0.5) / (df[t] + 0.5))
+    norm = K1 * (1 - B + B * doc_len[d] / max(doc_len.mean(), 1.0))
+    scores = np.zeros(n)
+    np.add.at(scores, d, idf * tf * (K1 + 1) / (tf + norm))
+    hits = np.flatnonzero(scores > 0)
+    return hits[np.argsort(-scores[hits], kind="stable")].tolist()
+
+def search(query, top_k=12, token_budget=800):
+    """选出和 query 最相关的记忆 (不超过 top_k 条、token_budget 个 token)；
+    相关的不够数时用最新的记忆补齐。query 为空 (语音/图片) 时直接取最新的。"""
+    with _lock:
+        if not _docs: return []
+        ranked = _rank(query) if query else []
+        seen = set(ranked)
+        ranked += [i for i in range(len(_docs) - 1, -1, -1) if i not in seen]
+        selected, used = [], 0
+        for doc_id in ranked:
+            if len(selected) >= top_k: break
+            cost = estimate_tokens(" ".join(str(x) for x in _docs[doc_id]))
+            if used + cost > token_budget: continue
+            selected.append(_docs[doc_id])
+            used += cost
+        return selected
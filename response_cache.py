@@ -0,0 +1,71 @@
+"""♻️ 按输入哈希缓存处理结果 (进程级 LRU + TTL，同一输入 single-flight)，防止 rerun 重复处理。"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_SIZE = 256     # 最多缓存多少条结果
+CACHE_TTL = 1800     # 秒: 结果保留多久
+
+_lock = threading.Lock()
+_entries = OrderedDict()   # key -> (expires_at, value)
+_inflight = {}             # key -> threading.Event (正在算的输入)
+_MISS = object()
+
+def content_key(content, kind=""):
+    """输入内容的 SHA-256 (支持 str / bytes / Streamlit UploadedFile)"""
+    if isinstance(content, str):
+        data = content.encode("utf-8")
+    elif isinstance(content, (bytes, bytearray)):
+        data = bytes(content)
+    elif hasattr(content, "getvalue"):
+        data = content.getvalue()
+    else:
+        data = repr(content).encode("utf-8")
+    return hashlib.sha256(kind.encode("utf-8") + b"\0" + data).hexdigest()
+
+def _get_locked(key):
+    hit = _entries.get(key)
+    if hit is None: return _MISS
+    expires_at, value = hit
+    if expires_at < time.time():
+        del _entries[key]
+        return _MISS
+    _entries.move_to_end(key)
+    return value
+
+def get(key, default=None):
+    with _lock:
+        value = _get_locked(key)
+    return default if value is _MISS else value
+
+def put(key, value):
+    with _lock:
+        _entries[key] = (time.time() + CACHE_TTL, value)
+        _entries.move_to_end(key)
+        while len(_entries) > CACHE_SIZE:
+            _entries.popitem(last=False)
+
+def get_or_compute(key, compute, cacheable=None):
+    """命中直接返回；没命中就调用 compute()。同一 key 并发时只有一个调用者真正执行。
+    cacheable(value) 返回 False 的结果 (比如出错的回复) 不进缓存，下次同样的输入重新算"""
+    while True:
+        with _lock:
+            value = _get_locked(key)
+            if value is not _MISS: return value
+            event = _inflight.get(key)
+            owner = event is None
+            if owner:
+                event = _inflight[key] = threading.Event()
+        if not owner:
+            event.wait()
+            continue  # 算完了去缓存里拿；算失败了就轮到自己算
+        try:
+            value = compute()
+            if cacheable is None or cacheable(value):
+                put(key, value)
+            return value
+        finally:
+            with _lock:
+                _inflight.pop(key, None)
+            event.set()
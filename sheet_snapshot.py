@@ -0,0 +1,78 @@
+"""🗄️ 工作表的本地列式快照 (manifest + 每表 .cols 文件)，冷启动读回后只从 Sheets 拉增量。"""
+import hashlib
+import json
+import os
+import threading
+
+FORMAT_VERSION = 1
+SNAPSHOT_DIR = os.getenv("OCTAVIA_SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "octavia_snapshot"))
+_SEP = "\0"
+
+_lock = threading.Lock()
+
+def _manifest_path():
+    return os.path.join(SNAPSHOT_DIR, "manifest.json")
+
+def _read_manifest(sheet_id):
+    try:
+        with open(_manifest_path(), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"format": FORMAT_VERSION, "sheet_id": sheet_id, "tables": {}}
+    if manifest.get("format") != FORMAT_VERSION or manifest.get("sheet_id") != sheet_id:
+        return {"format": FORMAT_VERSION, "sheet_id": sheet_id, "tables": {}}
+    return manifest
+
+def _replace(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def fingerprint(row):
+    """一行的指纹 (核对表里这一行有没有被改)"""
+    return hashlib.sha1(_SEP.join(str(v) for v in row).encode("utf-8")).hexdigest()
+
+def save(sheet_id, title, columns, rows):
+    """保存一张表的行 (按 columns 顺序的 tuple 列表)"""
+    cols = list(zip(*rows)) if rows else [()] * len(columns)
+    blobs, layout, offset = [], [], 0
+    for col in cols:
+        blob = _SEP.join(str(v).replace(_SEP, "") for v in col).encode("utf-8")
+        blobs.append(blob)
+        layout.append([offset, len(blob)])
+        offset += len(blob)
+    with _lock:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        _replace(os.path.join(SNAPSHOT_DIR, f"{title}.cols"), b"".join(blobs))
+        manifest = _read_manifest(sheet_id)
+        manifest["tables"][title] = {
+            "rows": len(rows),
+            "columns": list(columns),
+            "layout": layout,
+            "tail": fingerprint(rows[-1]) if rows else None,
+        }
+        _replace(_manifest_path(), json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+
+def load(sheet_id, title, columns):
+    """读回一张表: (rows, 末行指纹)；没有快照或列不一致返回 None"""
+    with _lock:
+        meta = _read_manifest(sheet_id)["tables"].get(title)
+        if not meta or meta["columns"] != list(columns): return None
+        try:
+            with open(os.path.join(SNAPSHOT_DIR, f"{title}.cols"), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+    n = meta["rows"]
+    if n == 0: return [], None
+    cols = []
+    for start, length in meta["layout"]:
+        values = data[start:start + length].decode("utf-8").split(_SEP)
+        if len(values) != n: return None  # 文件和 manifest 对不上
+        cols.append(values)
+    rows = list(zip(*cols))
+    if fingerprint(rows[-1]) != meta["tail"]: return None
+    return rows, meta["tail"]
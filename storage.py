@@ -0,0 +1,182 @@
+"""💾 存储引擎: Storage 接口 + SQLiteStorage (本地 SQLite，可选后台同步到 Sheets)。"""
+import abc
+import sqlite3
+import threading
+
+# 工作表 -> (SQLite 表名, 列名)；列顺序和工作表一致
+TABLES = {
+    "Transactions": ("transactions", ("date", "item", "amount", "category", "remarks")),
+    "Memory": ("memory", ("date", "category", "observation", "context")),
+    "Memory_Archive": ("memory_archive", ("date", "category", "observation", "context", "archived_on")),
+    "Assets": ("assets", ("category", "amount", "last_updated")),
+    "Tasks": ("tasks", ("date", "task", "status", "priority")),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY, date TEXT, item TEXT, amount REAL, category TEXT, remarks TEXT);
+CREATE INDEX IF NOT EXISTS idx_txn_date ON transactions(date);
+CREATE INDEX IF NOT EXISTS idx_txn_cat_date ON transactions(category, date);
+CREATE TABLE IF NOT EXISTS memory (
+    id INTEGER PRIMARY KEY, date TEXT, category TEXT, observation TEXT, context TEXT);
+CREATE INDEX IF NOT EXISTS idx_memory_cat ON memory(category);
+CREATE TABLE IF NOT EXISTS memory_archive (
+    id INTEGER PRIMARY KEY, date TEXT, category TEXT, observation TEXT, context TEXT, archived_on TEXT);
+CREATE TABLE IF NOT EXISTS assets (
+    category TEXT PRIMARY KEY, amount TEXT, last_updated TEXT);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY, date TEXT, task TEXT, status TEXT, priority TEXT);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# 区间/月份查询只算 YYYY-MM-DD 格式的日期 (和 Sheets 引擎的账本一致)
+_ISO_GLOB = "date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+
+def parse_amount(raw):
+    """清洗金额 ('RM1,200.50' -> 1200.5)，空值或无法解析返回 None"""
+    clean = str(raw).replace('RM', '').replace(',', '').strip()
+    if not clean: return None
+    try:
+        return float(clean)
+    except ValueError:
+        return None
+
+class Storage(abc.ABC):
+    """存储引擎接口。行都是按工作表列顺序的 list/tuple"""
+
+    def insert(self, title, row):
+        """追加一行"""
+        self.insert_many(title, [row])
+
+    @abc.abstractmethod
+    def insert_many(self, title, rows):
+        """追加多行 (一次事务)"""
+
+    @abc.abstractmethod
+    def rows(self, title):
+        """整表数据行 (按写入顺序)"""
+
+    @abc.abstractmethod
+    def count(self, title):
+        """数据行数"""
+
+    @abc.abstractmethod
+    def replace_rows(self, title, rows):
+        """整表替换 (记忆整理用)"""
+
+    @abc.abstractmethod
+    def expenses_by_date(self, day):
+        """某一天: (总额, ['item (amount)', ...])"""
+
+    @abc.abstractmethod
+    def finance_range(self, start, end, top_n=5):
+        """区间报表: {total, count, by_category, top_items}"""
+
+    @abc.abstractmethod
+    def ledger(self):
+        """按日期排好的明细账: [(date, amount, category, item)]"""
+
+    @abc.abstractmethod
+    def set_asset(self, category, amount, day):
+        """设置一个分类的余额"""
+
+    @abc.abstractmethod
+    def pending_tasks(self):
+        """没完成的待办: [(task, status, priority)]"""
+
+    @abc.abstractmethod
+    def get_meta(self, key, default=None):
+        """引擎元数据 (比如是否已从 Sheets 导入)"""
+
+    @abc.abstractmethod
+    def set_meta(self, key, value):
+        """写引擎元数据"""
+
+class SQLiteStorage(Storage):
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _table(self, title):
+        if title not in TABLES: raise KeyError(f"Unknown table: {title}")
+        return TABLES[title]
+
+    def _normalize(self, title, row):
+        """补齐/截断到表的列数；账目金额清洗成数字、空分类记为 Other"""
+        cols = self._table(title)[1]
+        row = ["" if v is None else v for v in list(row)[:len(cols)]]
+        row += [""] * (len(cols) - len(row))
+        if title == "Transactions":
+            row[2] = parse_amount(row[2])
+            row[3] = row[3] or "Other"
+        return row
+
+    def insert_many(self, title, rows):
+        table, cols = self._table(title)
+        rows = [self._normalize(title, r) for r in rows]
+        if not rows: return
+        verb = "INSERT OR REPLACE" if title == "Assets" else "INSERT"
+        sql = f"{verb} INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        with self._lock, self._db:
+            self._db.executemany(sql, rows)
+
+    def rows(self, title):
+        table, cols = self._table(title)
+        return [tuple("" if v is None else v for v in r)
+                for r in self._query(f"SELECT {', '.join(cols)} FROM {table} ORDER BY rowid")]
+
+    def count(self, title):
+        return self._query(f"SELECT COUNT(*) FROM {self._table(title)[0]}")[0][0]
+
+    def replace_rows(self, title, rows):
+        table, cols = self._table(title)
+        rows = [self._normalize(title, r) for r in rows]
+        sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        with self._lock, self._db:
+            self._db.execute(f"DELETE FROM {table}")
+            self._db.executemany(sql, rows)
+
+    def expenses_by_date(self, day):
+        rows = self._query("SELECT item, amount FROM transactions WHERE date = ? AND amount IS NOT NULL ORDER BY id", (day,))
+        return sum(a for _, a in rows), [f"{item} ({amount})" for item, amount in rows]
+
+    def finance_range(self, start, end, top_n=5):
+        where = f"date BETWEEN ? AND ? AND amount IS NOT NULL AND {_ISO_GLOB}"
+        by_cat = self._query(f"SELECT category, SUM(amount), COUNT(*) FROM transactions WHERE {where} "
+                             "GROUP BY category ORDER BY SUM(amount) DESC", (start, end))
+        top = self._query(f"SELECT item, amount, date FROM transactions WHERE {where} "
+                          "ORDER BY amount DESC, date DESC LIMIT ?", (start, end, top_n))
+        return {
+            "total": sum(r[1] for r in by_cat),
+            "count": sum(r[2] for r in by_cat),
+            "by_category": {c: v for c, v, _ in by_cat},
+            "top_items": [tuple(r) for r in top],
+        }
+
+    def ledger(self):
+        return self._query(f"SELECT date, amount, category, item FROM transactions "
+                           f"WHERE amount IS NOT NULL AND {_ISO_GLOB} ORDER BY date, id")
+
+    def set_asset(self, category, amount, day):
+        self.insert("Assets", [category, amount, day])
+
+    def pending_tasks(self):
+        return self._query("SELECT task, status, priority FROM tasks "
+                           "WHERE task != '' AND status != 'Done' ORDER BY id")
+
+    def get_meta(self, key, default=None):
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
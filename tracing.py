@@ -0,0 +1,143 @@
+"""🔬 Tracing (分阶段计时)
+
+一次回复慢，到底慢在哪一步? 热点路径上每个阶段都包一层 span，记录耗时:
+
+    with tracing.request("text"):            # 一次请求 (brain.process_input)，分配 trace id
+        with tracing.span("prompt_build"):   # 阶段，可以嵌套 (memory_fetch 在 prompt_build 里面)
+            ...
+
+阶段名: intent_parse、prompt_build、memory_fetch、upload、upload_poll、generate_content、
+json_extract、command、sheet_read、sheet_write、vercel_call。
+
+span 存在进程内的环形缓冲 (最近 RING_SIZE 条)，另有按阶段的累计计数。
+侧边栏 SYSTEM LOGS 显示各阶段延迟分布和最近一次请求的瀑布图；
+dumps_jsonl() / export_jsonl() 导出 JSON Lines，设了 OCTAVIA_TRACE_FILE 的话每条 span 实时追加到文件。
+"""
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+RING_SIZE = int(os.getenv("OCTAVIA_TRACE_SIZE", "2000"))
+TRACE_FILE = os.getenv("OCTAVIA_TRACE_FILE")   # 可选: 每条 span 实时追加成 JSON Lines
+
+_lock = threading.Lock()
+_ring = deque(maxlen=RING_SIZE)
+_totals = {}   # stage -> [次数, 出错次数, 累计毫秒]  (进程启动以来，不受环形缓冲淘汰影响)
+_ids = itertools.count(1)
+
+# 当前线程/协程所在的 trace id 和 span 栈 (线程池里的 span 没有 trace id，单独统计)
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_stack = contextvars.ContextVar("span_stack", default=())
+
+def _record(entry):
+    with _lock:
+        _ring.append(entry)
+        totals = _totals.setdefault(entry["stage"], [0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += not entry["ok"]
+        totals[2] += entry["ms"]
+        if TRACE_FILE:
+            try:
+                with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"Trace File Error: {e}")
+
+@contextmanager
+def span(stage, **attrs):
+    """给一个阶段计时；出异常也会记下 (ok=False) 再原样抛出。yield 出的 dict 可以补充属性"""
+    parents = _stack.get()
+    token = _stack.set(parents + (stage,))
+    start = time.time()
+    t = time.perf_counter()
+    ok = True
+    try:
+        yield attrs
+    except BaseException as e:
+        ok = False
+        attrs.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        _stack.reset(token)
+        _record({
+            "ts": start,
+            "trace": _trace_id.get(),
+            "stage": stage,
+            "parent": parents[-1] if parents else None,
+            "depth": len(parents),
+            "ms": (time.perf_counter() - t) * 1000,
+            "ok": ok,
+            "attrs": attrs,
+        })
+
+@contextmanager
+def request(kind, **attrs):
+    """一次完整请求: 分配新的 trace id，整体耗时记成 stage="request" 的 span"""
+    token = _trace_id.set(next(_ids))
+    try:
+        with span("request", kind=kind, **attrs) as a:
+            yield a
+    finally:
+        _trace_id.reset(token)
+
+def recent(limit=None, stage=None):
+    """最近的 span (新的在后)"""
+    with _lock:
+        spans = [s for s in _ring if stage is None or s["stage"] == stage]
+    return spans[-limit:] if limit else spans
+
+def last_trace():
+    """最近一次完整请求的全部 span (按开始时间排)"""
+    with _lock:
+        spans = list(_ring)
+    root = next((s for s in reversed(spans) if s["stage"] == "request"), None)
+    if root is None: return []
+    return sorted((s for s in spans if s["trace"] == root["trace"]), key=lambda s: s["ts"])
+
+def _pct(sorted_ms, p):
+    return sorted_ms[min(len(sorted_ms) - 1, int(p / 100 * len(sorted_ms)))]
+
+def breakdown():
+    """环形缓冲里各阶段的延迟分布: {stage: {n, errors, p50_ms, p95_ms, max_ms, total_ms}}，按总耗时排"""
+    by_stage = {}
+    for s in recent():
+        by_stage.setdefault(s["stage"], []).append(s)
+    out = {}
+    for stage, spans in by_stage.items():
+        ms = sorted(s["ms"] for s in spans)
+        out[stage] = {
+            "n": len(ms),
+            "errors": sum(not s["ok"] for s in spans),
+            "p50_ms": _pct(ms, 50),
+            "p95_ms": _pct(ms, 95),
+            "max_ms": ms[-1],
+            "total_ms": sum(ms),
+        }
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["total_ms"]))
+
+def counters():
+    """进程启动以来各阶段的累计: {stage: {count, errors, total_ms}}"""
+    with _lock:
+        return {stage: {"count": c, "errors": e, "total_ms": ms} for stage, (c, e, ms) in _totals.items()}
+
+def dumps_jsonl(spans=None):
+    """span 列表 -> JSON Lines 文本 (默认整个环形缓冲)"""
+    spans = recent() if spans is None else spans
+    return "".join(json.dumps(s, ensure_ascii=False) + "\n" for s in spans)
+
+def export_jsonl(path):
+    """把环形缓冲写到文件，返回写了多少条"""
+    spans = recent()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(dumps_jsonl(spans))
+    return len(spans)
+
+def clear():
+    with _lock:
+        _ring.clear()
+        _totals.clear()
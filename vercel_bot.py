@@ -1,9 +1,31 @@
 import requests
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+import tracing
 
 # Base URL for Vercel API
 BASE_URL = "https://api.vercel.com"
 
+CACHE_TTL = 15         # 秒: 同一个 URL 多久内直接用缓存 (过期后带 ETag 做条件请求)
+PAGE_SIZE = 100        # 项目列表每页条数 (Vercel 上限 100)
+MAX_WORKERS = 8        # 并发拉各项目最新部署的线程数
+REQUEST_TIMEOUT = 10
+
+# 🔌 一个长连接池，所有请求共用 (不再每次重新 TLS 握手)
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS))
+_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="vercel")
+
+_cache_lock = threading.Lock()
+_cache = {}   # (path, params) -> (expires_at, etag, data)
+
+class VercelError(Exception):
+    pass
+
 def get_headers():
     token = os.getenv("VERCEL_TOKEN")
     if not token:
@@ -13,56 +35,91 @@ def get_headers():
         "Content-Type": "application/json"
     }
 
-def get_latest_deployments(limit=3):
-    """获取最新的部署状态"""
+def _get_json(path, **params):
+    """GET Vercel API，带短期缓存；缓存过期后用 If-None-Match，304 就继续用旧数据"""
     headers = get_headers()
     if not headers:
-        return "❌ 没找到 VERCEL_TOKEN，请去 .env 文件里配置。"
-        
+        raise VercelError("没找到 VERCEL_TOKEN，请去 .env 文件里配置。")
+    team = os.getenv("VERCEL_TEAM_ID")
+    if team: params["teamId"] = team
+    key = (path, tuple(sorted(params.items())))
+
+    with _cache_lock:
+        hit = _cache.get(key)
+    if hit and hit[0] > time.time():
+        return hit[2]
+    if hit and hit[1]:
+        headers["If-None-Match"] = hit[1]
+
+    with tracing.span("vercel_call", path=path) as attrs:
+        response = _session.get(f"{BASE_URL}{path}", headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+        attrs["status"] = response.status_code
+    if response.status_code == 304 and hit:
+        data = hit[2]
+    elif response.status_code == 200:
+        data = response.json()
+    else:
+        raise VercelError(f"Vercel API Error: {response.status_code} - {response.text}")
+    with _cache_lock:
+        _cache[key] = (time.time() + CACHE_TTL, response.headers.get("ETag") or (hit[1] if hit else None), data)
+    return data
+
+def list_projects():
+    """所有项目 (自动翻页)"""
+    projects, until = [], None
+    while True:
+        params = {"limit": PAGE_SIZE}
+        if until: params["until"] = until
+        data = _get_json("/v9/projects", **params)
+        projects.extend(data.get("projects", []))
+        until = (data.get("pagination") or {}).get("next")
+        if not until: return projects
+
+def latest_deployment(project_id):
+    """某个项目最新的一次部署 (没有部署返回 None)"""
+    deployments = _get_json("/v6/deployments", projectId=project_id, limit=1).get("deployments", [])
+    return deployments[0] if deployments else None
+
+def get_status_snapshot():
+    """每个项目的最新部署，并发拉取。返回 [{project, state, url, created}]，最近部署的排前面"""
+    projects = list_projects()
+    latest = _pool.map(lambda p: latest_deployment(p["id"]), projects)
+    snapshot = []
+    for project, d in zip(projects, latest):
+        d = d or {}
+        snapshot.append({
+            "project": project.get("name"),
+            "state": d.get("state") or d.get("readyState") or "NO DEPLOYMENTS",
+            "url": d.get("url"),
+            "created": d.get("created") or d.get("createdAt") or 0,
+        })
+    snapshot.sort(key=lambda s: s["created"], reverse=True)
+    return snapshot
+
+def format_status(s):
+    state = s["state"]
+    icon = "✅" if state == "READY" else "❌" if state == "ERROR" else "⏳"
+    link = f" (https://{s['url']})" if s["url"] else ""
+    return f"{icon} **{s['project']}**: {state}{link}"
+
+def get_latest_deployments(limit=None):
+    """获取每个项目最新的部署状态 (limit: 只显示最近的几个项目)"""
     try:
-        url = f"{BASE_URL}/v6/deployments?limit={limit}"
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            data = response.json()
-            deployments = data.get('deployments', [])
-            
-            if not deployments:
-                return "没有找到任何近期部署。"
-                
-            report = []
-            for d in deployments:
-                # Calculate time ago roughly or just show raw string for now
-                state = d.get('state')
-                name = d.get('name')
-                url = d.get('url')
-                icon = "✅" if state == "READY" else "❌" if state == "ERROR" else "⏳"
-                
-                report.append(f"{icon} **{name}**: {state} (https://{url})")
-                
-            return "\n\n".join(report)
-        else:
-            return f"❌ Vercel API Error: {response.status_code} - {response.text}"
-            
+        snapshot = get_status_snapshot()
+        if not snapshot:
+            return "没有找到任何近期部署。"
+        return "\n\n".join(format_status(s) for s in snapshot[:limit])
+    except VercelError as e:
+        return f"❌ {e}"
     except Exception as e:
         return f"❌ System Error: {e}"
 
 def get_project_list():
     """列出所有项目"""
-    headers = get_headers()
-    if not headers:
-        return "❌ 没找到 VERCEL_TOKEN"
-        
     try:
-        url = f"{BASE_URL}/v9/projects"
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            data = response.json()
-            projects = data.get('projects', [])
-            names = [p.get('name') for p in projects]
-            return f"📦 项目列表 ({len(names)}): " + ", ".join(names)
-        else:
-            return f"Error: {response.status_code}"
+        names = [p.get('name') for p in list_projects()]
+        return f"📦 项目列表 ({len(names)}): " + ", ".join(names)
+    except VercelError as e:
+        return f"❌ {e}"
     except Exception as e:
         return f"Error: {e}"
@@ -0,0 +1,117 @@
+"""🛰️ Vercel Watcher (部署状态后台监控)
+
+后台线程定期拉 vercel_bot.get_status_snapshot()，在本地保存每个项目的最新状态，
+只把状态变化 (READY -> ERROR、BUILDING -> READY ...) 写进变更流 (change feed)。
+侧边栏 SYSTEM LOGS 和聊天直接读本地快照/变更流，不用再等 Vercel API。
+
+轮询间隔自适应: 有项目在 BUILDING/QUEUED 时快轮询，全部空闲时慢轮询，出错时退避。
+"""
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import vercel_bot
+
+POLL_FAST = vercel_bot.CACHE_TTL   # 秒: 有部署在构建时 (再快也只会命中缓存)
+POLL_SLOW = 120                    # 秒: 全部空闲时
+POLL_ERROR_MAX = 600               # 秒: 连续出错时的最长退避
+FEED_SIZE = 100                    # 变更流保留多少条
+ACTIVE_STATES = {"BUILDING", "QUEUED", "INITIALIZING"}
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_thread = None
+_snapshot = {}         # project -> {project, state, url, created}
+_feed = deque(maxlen=FEED_SIZE)   # 变更事件 (seq 递增)
+_seq = 0
+_last_poll = 0.0       # 上次成功轮询的时间
+_last_error = None
+
+def _record_changes(snapshot):
+    """和旧快照比较，只把状态变化写进变更流。第一次轮询只建立基线"""
+    global _seq
+    with _lock:
+        first = not _snapshot and _last_poll == 0
+        for s in snapshot:
+            old = _snapshot.get(s["project"])
+            if not first and (old is None or old["state"] != s["state"]):
+                _seq += 1
+                _feed.append({
+                    "seq": _seq,
+                    "time": time.time(),
+                    "project": s["project"],
+                    "old": old["state"] if old else None,
+                    "new": s["state"],
+                    "url": s["url"],
+                })
+        _snapshot.clear()
+        _snapshot.update((s["project"], s) for s in snapshot)
+
+def poll_once():
+    """拉一次快照并记录变化，返回下一次轮询要等多久"""
+    global _last_poll, _last_error
+    snapshot = vercel_bot.get_status_snapshot()
+    _record_changes(snapshot)
+    with _lock:
+        _last_poll, _last_error = time.time(), None
+    return POLL_FAST if any(s["state"] in ACTIVE_STATES for s in snapshot) else POLL_SLOW
+
+def _loop():
+    global _last_error
+    delay_on_error = POLL_FAST
+    while True:
+        try:
+            delay = poll_once()
+            delay_on_error = POLL_FAST
+        except Exception as e:
+            with _lock:
+                _last_error = str(e)
+            delay = delay_on_error
+            delay_on_error = min(delay_on_error * 2, POLL_ERROR_MAX)
+        _wake.wait(delay)
+        _wake.clear()
+
+def start():
+    """启动后台轮询 (重复调用无副作用；没配置 VERCEL_TOKEN 就不启动)"""
+    global _thread
+    if not os.getenv("VERCEL_TOKEN"): return False
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, name="vercel-watcher", daemon=True)
+            _thread.start()
+    return True
+
+def poke():
+    """马上轮询一次 (聊天里问部署状态时调用；后台线程没在跑就什么也不做)"""
+    _wake.set()
+
+def snapshot():
+    """本地快照: [{project, state, url, created}]，最近部署的排前面；还没轮询过返回 None"""
+    with _lock:
+        if not _last_poll: return None
+        return sorted(_snapshot.values(), key=lambda s: s["created"], reverse=True)
+
+def changes(since=0, limit=None):
+    """seq > since 的状态变化 (旧的在前)"""
+    with _lock:
+        events = [e for e in _feed if e["seq"] > since]
+    return events[-limit:] if limit else events
+
+def format_change(e):
+    stamp = datetime.fromtimestamp(e["time"]).strftime("%H:%M:%S")
+    return f"[{stamp}] {e['project']}: {e['old'] or 'NEW'} -> {e['new']}"
+
+def status_report():
+    """给聊天用的部署报告: 本地快照 + 最近的状态变化；还没有快照就现拉"""
+    current = snapshot()
+    if current is None or time.time() - _last_poll > 2 * POLL_SLOW:  # 没在跑或一直出错: 快照不可信
+        return vercel_bot.get_latest_deployments()
+    if not current:
+        return "没有找到任何近期部署。"
+    report = "\n\n".join(vercel_bot.format_status(s) for s in current)
+    recent = changes(limit=5)
+    if recent:
+        report += "\n\n**最近变化:**\n" + "\n".join(f"- {format_change(e)}" for e in recent)
+    return report